@@ -1,7 +1,7 @@
 from django.contrib import admin
 from mptt.admin import MPTTModelAdmin
 
-from .models import Product, Review, Category, Shop, Cart, ProdCategory, Order
+from .models import Product, Review, Category, Shop, Cart, ProdCategory, Order, OrderGroup
 
 
 # Register your models here.
@@ -19,9 +19,13 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('title', 'price', 'count', 'user', 'status')
+    list_display = ('title', 'price', 'count', 'group', 'status')
     # search_fields = ['title', 'prodcategory__name']
 
+@admin.register(OrderGroup)
+class OrderGroupAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'total', 'time_created')
+
 admin.site.register(ProdCategory, CategoryAdmin)
 
 # admin.site.register(Product)
@@ -0,0 +1,136 @@
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Order, ShopDailySales
+
+SALES_FIELDS = ["revenue", "units", "orders", "delivered_revenue", "delivered_units"]
+REBUILD_BATCH_SIZE = 2000
+DEFAULT_PERIOD = timedelta(days=30)
+
+# Прибавляет счётчики к строке (shop, product, day), создавая её при необходимости.
+# Строки с удалённым товаром (product_id IS NULL) не конфликтуют и вставляются
+# отдельно - при чтении счётчики всё равно суммируются.
+BUMP_SQL = """
+    INSERT INTO chipi_shopdailysales (shop_id, product_id, day, %(fields)s)
+    VALUES %%s
+    ON CONFLICT (shop_id, product_id, day) DO UPDATE
+    SET %(updates)s
+""" % {
+    "fields": ", ".join(SALES_FIELDS),
+    "updates": ", ".join(f"{f} = chipi_shopdailysales.{f} + excluded.{f}" for f in SALES_FIELDS),
+}
+ROW_PLACEHOLDER = "(%s)" % ", ".join(["%s"] * (3 + len(SALES_FIELDS)))
+
+
+def sale_day(time_created):
+    return timezone.localdate(time_created)
+
+
+def bump_sales(deltas):
+    """Применяет приращения {(shop_id, product_id, day): [revenue, units, orders, ...]} одним запросом."""
+    rows = [(key, delta) for key, delta in deltas.items() if key[0] is not None and any(delta)]
+    if not rows:
+        return
+    params = []
+    for (shop_id, product_id, day), delta in rows:
+        params += [shop_id, product_id, connection.ops.adapt_datefield_value(day), *delta]
+    with connection.cursor() as cursor:
+        cursor.execute(BUMP_SQL % ", ".join([ROW_PLACEHOLDER] * len(rows)), params)
+
+
+def add_delta(deltas, line, revenue=0, units=0, orders=0, delivered_revenue=0, delivered_units=0):
+    key = (line.shop_id, line.product_id, sale_day(line.time_created))
+    delta = deltas.setdefault(key, [0] * len(SALES_FIELDS))
+    for i, value in enumerate([revenue, units, orders, delivered_revenue, delivered_units]):
+        delta[i] += value
+
+
+def record_sales(lines):
+    """Учитывает новые строки заказов (вызывается при оплате в той же транзакции)."""
+    deltas = {}
+    for line in lines:
+        delivered = line.status == Order.Status.DELIVERED
+        add_delta(
+            deltas, line,
+            revenue=line.price * line.count,
+            units=line.count,
+            orders=1,
+            delivered_revenue=line.price * line.count if delivered else 0,
+            delivered_units=line.count if delivered else 0,
+        )
+    bump_sales(deltas)
+
+
+def record_status_change(lines, status):
+    """Учитывает смену статуса строк; lines - строки со старым статусом."""
+    deltas = {}
+    for line in lines:
+        was_delivered = line.status == Order.Status.DELIVERED
+        delivered = status == Order.Status.DELIVERED
+        if was_delivered != delivered:
+            sign = 1 if delivered else -1
+            add_delta(
+                deltas, line,
+                delivered_revenue=sign * line.price * line.count,
+                delivered_units=sign * line.count,
+            )
+    bump_sales(deltas)
+
+
+def rebuild_sales(shop=None):
+    """Пересчитывает сводку по строкам заказов. Возвращает число строк сводки."""
+    lines = Order.objects.filter(shop__isnull=False)
+    rollups = ShopDailySales.objects.all()
+    if shop is not None:
+        lines = lines.filter(shop=shop)
+        rollups = rollups.filter(shop=shop)
+
+    delivered = Q(status=Order.Status.DELIVERED)
+    rows = (
+        lines.annotate(day=TruncDate("time_created"))
+        .values("shop_id", "product_id", "day")
+        .annotate(
+            revenue=Sum(F("price") * F("count")),
+            units=Sum("count"),
+            orders=Count("id"),
+            delivered_revenue=Sum(F("price") * F("count"), filter=delivered, default=0),
+            delivered_units=Sum("count", filter=delivered, default=0),
+        )
+        .order_by()
+    )
+
+    created = 0
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        for row in rows.iterator(chunk_size=REBUILD_BATCH_SIZE):
+            batch.append(ShopDailySales(**row))
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                created += len(ShopDailySales.objects.bulk_create(batch))
+                batch = []
+        created += len(ShopDailySales.objects.bulk_create(batch))
+    return created
+
+
+def sales_period(date_from=None, date_to=None):
+    """Период отчёта; по умолчанию последние 30 дней."""
+    date_to = date_to or timezone.localdate()
+    date_from = date_from or date_to - DEFAULT_PERIOD
+    return date_from, date_to
+
+
+def sales_report(shop, date_from, date_to):
+    """Итоги за период, по дням и по товарам - три агрегата по индексу (shop, day)."""
+    sales = ShopDailySales.objects.filter(shop=shop, day__gte=date_from, day__lte=date_to).order_by()
+    sums = {field: Sum(field, default=0) for field in SALES_FIELDS}
+    return {
+        "totals": sales.aggregate(**sums),
+        "days": list(sales.values("day").annotate(**sums).order_by("-day")),
+        "products": list(
+            sales.values("product_id", "product__title").annotate(**sums).order_by("-revenue")
+        ),
+    }
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ChipiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chipi'
+
+    def ready(self):
+        from . import signals  # noqa: F401
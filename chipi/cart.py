@@ -0,0 +1,189 @@
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from .models import Cart, Product
+from .ranking import invalidate_feed
+
+# количество и сумма лежат отдельными ключами, чтобы добавление товара меняло их через cache.incr
+SUMMARY_COUNT_KEY = "cart_count:{}"
+SUMMARY_SUM_KEY = "cart_sum:{}"
+SUMMARY_TIMEOUT = 60 * 60
+
+# Добавление в корзину одним запросом: вставка новой строки или увеличение
+# существующей, но не больше остатка на складе. Ничего не возвращает, если
+# товара нет в наличии или в корзине уже весь остаток.
+ADD_SQL = """
+    INSERT INTO chipi_cart (user_id, product_id, count, time_created, time_updated)
+    SELECT %(user_id)s, p.id, CASE WHEN p.count < %(delta)s THEN p.count ELSE %(delta)s END, %(now)s, %(now)s
+    FROM chipi_product p
+    WHERE p.id = %(product_id)s AND p.count > 0
+    ON CONFLICT (user_id, product_id) DO UPDATE
+    SET count = CASE
+            WHEN chipi_cart.count + %(delta)s > (SELECT count FROM chipi_product WHERE id = excluded.product_id)
+            THEN (SELECT count FROM chipi_product WHERE id = excluded.product_id)
+            ELSE chipi_cart.count + %(delta)s
+        END,
+        time_updated = excluded.time_updated
+    WHERE chipi_cart.count < (SELECT count FROM chipi_product WHERE id = excluded.product_id)
+    RETURNING count,
+        (SELECT count FROM chipi_product WHERE id = chipi_cart.product_id),
+        (SELECT price FROM chipi_product WHERE id = chipi_cart.product_id),
+        time_created = %(now)s
+"""
+
+DECREMENT_SQL = """
+    UPDATE chipi_cart SET count = count - %(delta)s, time_updated = %(now)s
+    WHERE user_id = %(user_id)s AND product_id = %(product_id)s AND count > %(delta)s
+    RETURNING count
+"""
+
+
+def reconcile_carts(carts=None):
+    """Приводит корзины в соответствие с остатками на складе.
+
+    Товары, которых не осталось, удаляются одним DELETE, а количество,
+    превышающее остаток, урезается одним UPDATE. Если расхождений нет,
+    выполняется только один SELECT. Возвращает (удалено, исправлено).
+    """
+    if carts is None:
+        carts = Cart.objects.all()
+    stale = carts.filter(Q(product__count=0) | Q(count__gt=F("product__count")))
+    user_ids = set(stale.values_list("user__user_id", flat=True))
+    if not user_ids:
+        return 0, 0
+
+    stock = Product.objects.filter(pk=OuterRef("product_id")).order_by().values("count")[:1]
+    removed, _ = carts.filter(product__count=0).delete()
+    clamped = carts.filter(count__gt=F("product__count")).update(
+        count=Least(F("count"), Subquery(stock))
+    )
+    invalidate_cart_summary(*user_ids)
+    return removed, clamped
+
+
+def cart_lines(buyer):
+    """Строки корзины покупателя после сверки с остатками, вместе с товаром и магазином."""
+    carts = Cart.objects.filter(user=buyer)
+    reconcile_carts(carts)
+    return list(carts.select_related("product__shop").order_by("-time_created"))
+
+
+def aggregate_totals(carts):
+    """Общее количество и сумма строк корзины одним агрегатным запросом."""
+    totals = carts.aggregate(
+        total_count=Sum("count"),
+        total_sum=Sum(F("count") * F("product__price")),
+    )
+    return totals["total_count"] or 0, totals["total_sum"] or 0
+
+
+def cart_totals(buyer):
+    return aggregate_totals(Cart.objects.filter(user=buyer))
+
+
+def summary_keys(user_id):
+    return SUMMARY_COUNT_KEY.format(user_id), SUMMARY_SUM_KEY.format(user_id)
+
+
+def cart_summary(user_id):
+    """Количество товаров и сумма корзины для шапки сайта, кэшируется по пользователю."""
+    count_key, sum_key = summary_keys(user_id)
+    cached = cache.get_many([count_key, sum_key])
+    if len(cached) == 2:
+        return {"count": cached[count_key], "sum": cached[sum_key]}
+    total_count, total_sum = aggregate_totals(Cart.objects.filter(user__user_id=user_id))
+    cache.set_many({count_key: total_count, sum_key: total_sum}, SUMMARY_TIMEOUT)
+    return {"count": total_count, "sum": total_sum}
+
+
+def invalidate_cart_summary(*user_ids):
+    """Сбрасывает сводку корзины и персональную подборку: она зависит от корзины и заказов."""
+    cache.delete_many([key for user_id in user_ids for key in summary_keys(user_id)])
+    invalidate_feed(*user_ids)
+
+
+def bump_cart_summary(user_id, count, amount):
+    """Сдвигает закэшированную сводку на добавленные товары без запроса к базе.
+
+    Если сводки нет в кэше, она посчитается агрегатом при следующем чтении.
+    """
+    try:
+        for key, value in zip(summary_keys(user_id), (count, amount)):
+            cache.incr(key, value)
+    except ValueError:
+        cache.delete_many(summary_keys(user_id))
+    invalidate_feed(user_id)
+
+
+def add_to_cart(buyer, product_id, delta=1):
+    """Атомарно увеличивает количество товара в корзине, не превышая остаток.
+
+    Возвращает (количество в корзине, остаток, добавлено ли). Остаток равен
+    None, если такого товара нет.
+    """
+    params = {
+        "user_id": buyer.pk,
+        "product_id": product_id,
+        "delta": delta,
+        "now": connection.ops.adapt_datetimefield_value(timezone.now()),
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(ADD_SQL, params)
+        row = cursor.fetchone()
+        if row:
+            count, stock, price, inserted = row
+            # новая строка добавила всё своё количество, а обновление - ровно delta,
+            # если не упёрлось в остаток; иначе прибавку не узнать и сводка сбрасывается
+            added = count if inserted else delta if count < stock else None
+            if added is None:
+                invalidate_cart_summary(buyer.user_id)
+            else:
+                bump_cart_summary(buyer.user_id, added, added * price)
+            return count, stock, True
+
+        # товара нет в наличии или в корзине уже весь остаток
+        cursor.execute(
+            "SELECT p.count, c.count FROM chipi_product p "
+            "LEFT JOIN chipi_cart c ON c.product_id = p.id AND c.user_id = %s WHERE p.id = %s",
+            [buyer.pk, product_id],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return 0, None, False
+    return row[1] or 0, row[0], False
+
+
+def remove_from_cart(buyer, product_id, delta=1):
+    """Атомарно уменьшает количество товара в корзине, удаляя строку при нуле. Возвращает новое количество."""
+    params = {
+        "user_id": buyer.pk,
+        "product_id": product_id,
+        "delta": delta,
+        "now": connection.ops.adapt_datetimefield_value(timezone.now()),
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(DECREMENT_SQL, params)
+        row = cursor.fetchone()
+    if row is None:
+        Cart.objects.filter(user=buyer, product_id=product_id).delete()
+    invalidate_cart_summary(buyer.user_id)
+    return row[0] if row else 0
+
+
+def apply_cart_changes(buyer, changes):
+    """Применяет пачку изменений {product_id: delta} в одной транзакции.
+
+    Возвращает {product_id: (количество в корзине, остаток)} после изменений.
+    """
+    with transaction.atomic():
+        counts = {}
+        for product_id, delta in changes.items():
+            if delta > 0:
+                counts[product_id] = add_to_cart(buyer, product_id, delta)[0]
+            elif delta < 0:
+                counts[product_id] = remove_from_cart(buyer, product_id, -delta)
+        stock = dict(Product.objects.filter(pk__in=counts).values_list("pk", "count"))
+    return {product_id: (count, stock.get(product_id, 0)) for product_id, count in counts.items()}
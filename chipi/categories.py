@@ -0,0 +1,34 @@
+import time
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .models import ProdCategory
+
+TREE_VERSION_KEY = "category_tree:version"
+# Сброс по сигналам сразу виден всем процессам только при общем кэше (Redis, Memcached).
+# С LocMemCache другие процессы узнают о новой версии не позже чем через TREE_TIMEOUT.
+TREE_TIMEOUT = 5 * 60
+
+
+def tree_version():
+    version = cache.get(TREE_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        cache.set(TREE_VERSION_KEY, version, TREE_TIMEOUT)
+    return version
+
+
+def invalidate_tree():
+    """Новая версия ключа: закэшированное дерево перестаёт использоваться."""
+    cache.set(TREE_VERSION_KEY, time.time_ns(), TREE_TIMEOUT)
+
+
+def category_tree_html():
+    """HTML дерева категорий для шапки сайта, один раз на версию дерева."""
+    key = f"category_tree:{tree_version()}"
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string("chipi/category_tree.html", {"ctg": ProdCategory.objects.all()})
+        cache.set(key, html, TREE_TIMEOUT)
+    return html
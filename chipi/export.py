@@ -0,0 +1,93 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Order
+
+EXPORT_CHUNK_SIZE = 2000
+
+# (поле выборки, колонка в файле)
+EXPORT_FIELDS = [
+    ("id", "line_id"),
+    ("group_id", "order_id"),
+    ("time_created", "time_created"),
+    ("title", "title"),
+    ("count", "count"),
+    ("price", "price"),
+    ("status", "status"),
+    ("track", "track"),
+    ("group__last_name", "last_name"),
+    ("group__first_name", "first_name"),
+    ("group__phone", "phone"),
+    ("group__email", "email"),
+    ("group__index", "index"),
+    ("group__city", "city"),
+    ("group__addr", "addr"),
+]
+STATUS_INDEX = [field for field, _ in EXPORT_FIELDS].index("status")
+STATUS_LABELS = dict(Order.Status.choices)
+
+# С этих символов таблицы начинают формулу: такие ячейки CSV экранируются апострофом
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: writerow возвращает строку вместо записи в буфер."""
+
+    def write(self, value):
+        return value
+
+
+def day_start(value):
+    """Начало дня ГГГГ-ММ-ДД; None, если даты нет или такого дня не бывает (2026-02-30)."""
+    try:
+        day = parse_date(value or "")
+    except ValueError:
+        return None
+    return timezone.make_aware(datetime.combine(day, time.min)) if day else None
+
+
+def export_rows(shop, date_from=None, date_to=None, status=None):
+    """Строки заказов магазина кортежами, порциями по EXPORT_CHUNK_SIZE, без загрузки всего в память.
+
+    date_from и date_to - даты в формате ГГГГ-ММ-ДД, обе включительно.
+    """
+    lines = Order.objects.filter(shop=shop)
+    start = day_start(date_from)
+    if start:
+        lines = lines.filter(time_created__gte=start)
+    end = day_start(date_to)
+    if end:
+        lines = lines.filter(time_created__lt=end + timedelta(days=1))
+    if status is not None:
+        lines = lines.filter(status=status)
+
+    rows = lines.order_by("time_created", "id").values_list(*[field for field, _ in EXPORT_FIELDS])
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        row = list(row)
+        row[STATUS_INDEX] = STATUS_LABELS.get(row[STATUS_INDEX], row[STATUS_INDEX])
+        yield row
+
+
+def csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_stream(rows):
+    writer = csv.writer(Echo())
+    # заголовок уходит клиенту до первого запроса к базе
+    yield "\ufeff" + writer.writerow([column for _, column in EXPORT_FIELDS])
+    for row in rows:
+        yield writer.writerow([csv_cell(value) for value in row])
+
+
+def jsonl_stream(rows):
+    columns = [column for _, column in EXPORT_FIELDS]
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
@@ -1,3 +1,6 @@
+import csv
+import io
+
 from django import forms
 from .models import Product, Category, Shop, ProductImage, Review, Order
 
@@ -76,4 +79,29 @@ class EditOrderForm(forms.ModelForm):
         labels = {
             'status': 'Статус',
             'track': 'Трек-номер',
-        }
\ No newline at end of file
+        }
+
+
+class BulkOrderForm(forms.Form):
+    status = forms.TypedChoiceField(
+        choices=[('', 'Не менять')] + Order.Status.choices,
+        coerce=int,
+        empty_value=None,
+        required=False,
+        label='Статус',
+    )
+    tracks = forms.FileField(required=False, label='Трек-номера (CSV: номер строки заказа, трек-номер)')
+
+    def clean_tracks(self):
+        file = self.cleaned_data['tracks']
+        if not file:
+            return {}
+        tracks = {}
+        try:
+            for row in csv.reader(io.StringIO(file.read().decode('utf-8-sig'))):
+                if not row or not row[0].strip():
+                    continue
+                tracks[int(row[0])] = row[1].strip()
+        except (UnicodeDecodeError, ValueError, IndexError, csv.Error):
+            raise forms.ValidationError('Файл должен быть в формате CSV: номер строки заказа, трек-номер')
+        return tracks
@@ -0,0 +1,159 @@
+"""FP-Growth: частые наборы товаров в покупках.
+
+Модуль не зависит от Django, чтобы его можно было запускать в отдельных
+процессах. Покупка - набор id товаров, наборы возвращаются кортежами id
+по возрастанию.
+"""
+from collections import defaultdict
+from multiprocessing import Pool
+
+
+class FPNode:
+    __slots__ = ("item", "count", "parent", "children", "link")
+
+    def __init__(self, item, parent):
+        self.item = item
+        self.count = 0
+        self.parent = parent
+        self.children = {}
+        self.link = None
+
+
+def count_items(transactions):
+    counts = defaultdict(int)
+    for items, count in transactions:
+        for item in items:
+            counts[item] += count
+    return counts
+
+
+def build_tree(transactions, min_count, rank=None):
+    """Строит FP-дерево по [(товары, количество)].
+
+    Возвращает таблицу заголовков {товар: [количество, первый узел]} или None,
+    если частых товаров нет. rank - общий порядок товаров; по умолчанию
+    товары упорядочиваются по убыванию частоты внутри этих покупок.
+    """
+    counts = count_items(transactions)
+    frequent = {item: count for item, count in counts.items() if count >= min_count}
+    if not frequent:
+        return None
+    if rank is None:
+        rank = {item: i for i, item in enumerate(sorted(frequent, key=lambda item: (-frequent[item], item)))}
+
+    header = {item: [count, None] for item, count in frequent.items()}
+    root = FPNode(None, None)
+    for items, count in transactions:
+        node = root
+        for item in sorted((item for item in items if item in frequent), key=rank.__getitem__):
+            child = node.children.get(item)
+            if child is None:
+                child = node.children[item] = FPNode(item, node)
+                child.link = header[item][1]
+                header[item][1] = child
+            child.count += count
+            node = child
+    return header
+
+
+def mine_tree(header, min_count, max_length, result, suffix=(), items=None):
+    """Добавляет в result частые наборы, оканчивающиеся на suffix; items - какие товары разбирать на верхнем уровне."""
+    for item in header if items is None else items:
+        if item not in header:
+            continue
+        count, node = header[item]
+        itemset = suffix + (item,)
+        result[tuple(sorted(itemset))] = count
+        if len(itemset) >= max_length:
+            continue
+
+        # условная база: пути от корня до каждого узла товара
+        base = []
+        while node is not None:
+            path = []
+            parent = node.parent
+            while parent.item is not None:
+                path.append(parent.item)
+                parent = parent.parent
+            if path:
+                base.append((path, node.count))
+            node = node.link
+
+        subtree = build_tree(base, min_count)
+        if subtree:
+            mine_tree(subtree, min_count, max_length, result, itemset)
+
+
+def global_rank(transactions, min_count):
+    counts = count_items(transactions)
+    frequent = sorted((item for item, count in counts.items() if count >= min_count), key=lambda item: (-counts[item], item))
+    return {item: i for i, item in enumerate(frequent)}
+
+
+def mine_shard(args):
+    transactions, items, min_count, max_length, rank = args
+    result = {}
+    header = build_tree(transactions, min_count, rank)
+    if header:
+        mine_tree(header, min_count, max_length, result, items=items)
+    return result
+
+
+def partition(transactions, rank, workers):
+    """Делит покупки между процессами по группам товаров (parallel FP-Growth).
+
+    Товар попадает в группу rank % workers. Для каждой группы из покупки
+    берётся один префикс (в общем порядке) до последнего товара группы.
+    Процесс разбирает только наборы, последний товар которых в его группе,
+    поэтому каждый набор находится ровно одним процессом и с точным числом.
+    """
+    shards = [[] for _ in range(workers)]
+    for items, count in transactions:
+        path = sorted((item for item in items if item in rank), key=rank.__getitem__)
+        emitted = set()
+        for end in range(len(path) - 1, -1, -1):
+            group = rank[path[end]] % workers
+            if group not in emitted:
+                emitted.add(group)
+                shards[group].append((path[: end + 1], count))
+    groups = [[] for _ in range(workers)]
+    for item, i in rank.items():
+        groups[i % workers].append(item)
+    return shards, groups
+
+
+def frequent_itemsets(transactions, min_count, max_length=3, workers=1):
+    """Частые наборы {кортеж товаров: число покупок} длиной до max_length.
+
+    transactions - список наборов товаров. При workers > 1 покупки делятся
+    между процессами, результат тот же.
+    """
+    transactions = [(items, 1) for items in transactions]
+    rank = global_rank(transactions, min_count)
+    if workers <= 1:
+        return mine_shard((transactions, list(rank), min_count, max_length, rank))
+
+    shards, groups = partition(transactions, rank, workers)
+    result = {}
+    with Pool(workers) as pool:
+        tasks = [(shard, items, min_count, max_length, rank) for shard, items in zip(shards, groups)]
+        for part in pool.imap_unordered(mine_shard, tasks):
+            result.update(part)
+    return result
+
+
+def association_rules(itemsets, total, min_confidence):
+    """Правила antecedent -> consequent с одним товаром справа.
+
+    Возвращает кортежи (antecedent, consequent, count, support, confidence, lift).
+    """
+    for itemset, count in itemsets.items():
+        if len(itemset) < 2:
+            continue
+        for consequent in itemset:
+            antecedent = tuple(item for item in itemset if item != consequent)
+            confidence = count / itemsets[antecedent]
+            if confidence < min_confidence:
+                continue
+            lift = confidence * total / itemsets[(consequent,)]
+            yield antecedent, consequent, count, count / total, confidence, lift
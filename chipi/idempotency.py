@@ -0,0 +1,123 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+KEY_TTL = timedelta(hours=24)
+HEADER = "HTTP_IDEMPOTENCY_KEY"
+FIELD = "idempotency_key"
+
+# сколько ждать, пока повторный запрос с тем же ключом завершится в другом потоке
+WAIT_TIMEOUT = 5
+WAIT_STEP = 0.1
+# пока ответа нет, ключ живёт недолго: если процесс упал, ключ освободится сам
+IN_PROGRESS_TTL = timedelta(seconds=WAIT_TIMEOUT * 6)
+# поля, которые не входят в отпечаток запроса
+UNHASHED_FIELDS = {FIELD, "csrfmiddlewaretoken"}
+
+
+def get_client_key(request):
+    return request.META.get(HEADER) or request.POST.get(FIELD) or ""
+
+
+def make_key(request, client_key):
+    """Ключ хранилища: ключи разных пользователей и адресов не пересекаются."""
+    raw = f"{request.user.pk}:{request.path}:{client_key}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def request_hash(request):
+    """Отпечаток данных запроса: поля формы и имена с размерами файлов."""
+    fields = sorted((name, values) for name, values in request.POST.lists() if name not in UNHASHED_FIELDS)
+    files = sorted((name, [(f.name, f.size) for f in files]) for name, files in request.FILES.lists())
+    raw = json.dumps([fields, files], ensure_ascii=False)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def stored_response(record):
+    response = HttpResponse(bytes(record.body), status=record.status_code, content_type=record.content_type or None)
+    if record.location:
+        response["Location"] = record.location
+    response["Idempotent-Replay"] = "true"
+    return response
+
+
+def store_response(key, response):
+    IdempotencyKey.objects.filter(pk=key).update(
+        status_code=response.status_code,
+        content_type=response.get("Content-Type", ""),
+        location=response.get("Location", ""),
+        body=b"" if response.has_header("Location") else response.content,
+        expires_at=timezone.now() + KEY_TTL,
+    )
+
+
+def wait_for_response(key):
+    """Ждёт, пока выполнится запрос с тем же ключом. None - не дождались."""
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        record = IdempotencyKey.objects.filter(pk=key, expires_at__gt=timezone.now()).first()
+        if record is None:
+            return None
+        if record.status_code:
+            return record
+        time.sleep(WAIT_STEP)
+    return None
+
+
+def idempotent(view):
+    """Повторный POST с тем же ключом идемпотентности возвращает сохранённый ответ.
+
+    Ключ передаётся заголовком Idempotency-Key или полем idempotency_key.
+    Запросы без ключа выполняются как обычно. Тот же ключ с другими данными
+    получает 422. Ответы 5xx не сохраняются, чтобы запрос можно было
+    повторить. Пока запрос выполняется, ключ держится IN_PROGRESS_TTL, и
+    только сохранённый ответ живёт KEY_TTL.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        client_key = get_client_key(request)
+        if request.method != "POST" or not client_key or not request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+
+        key = make_key(request, client_key)
+        fingerprint = request_hash(request)
+        now = timezone.now()
+        IdempotencyKey.objects.filter(pk=key, expires_at__lte=now).delete()
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(key=key, request_hash=fingerprint, expires_at=now + IN_PROGRESS_TTL)
+        except IntegrityError:
+            if IdempotencyKey.objects.filter(pk=key).exclude(request_hash=fingerprint).exists():
+                return JsonResponse({"status": "error", "detail": "idempotency key reused"}, status=422)
+            record = wait_for_response(key)
+            if record is None:
+                return JsonResponse({"status": "error", "detail": "request in progress"}, status=409)
+            return stored_response(record)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            IdempotencyKey.objects.filter(pk=key).delete()
+            raise
+
+        if response.status_code >= 500 or getattr(response, "streaming", False):
+            IdempotencyKey.objects.filter(pk=key).delete()
+        else:
+            store_response(key, response)
+        return response
+
+    return wrapper
+
+
+def expire_keys():
+    """Удаляет истёкшие ключи. Возвращает их количество."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
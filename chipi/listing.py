@@ -0,0 +1,49 @@
+from django.db.models import Exists, OuterRef
+
+from .models import Cart, Favorite, Product
+from .search import search_products
+
+
+def product_listing(category=None, search_query="", min_price=None, max_price=None, favorites_of=None):
+    """Выборка товаров для каталога.
+
+    Рейтинг хранится в колонках товара, а данные конкретного покупателя
+    (корзина, избранное) сюда не входят - их добавляет user_overlay для
+    уже выбранной страницы. Поэтому запрос одинаков для всех пользователей.
+    """
+    queryset = Product.objects.select_related("shop").order_by("id")
+
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+    if category:
+        # категория листается по (price, id): для листовой категории этот порядок
+        # даёт индекс (prodcategory, price) без сортировки всех её товаров
+        if category.is_leaf_node():
+            queryset = queryset.filter(prodcategory=category)
+        else:
+            queryset = queryset.filter(
+                prodcategory__tree_id=category.tree_id,
+                prodcategory__lft__gte=category.lft,
+                prodcategory__rght__lte=category.rght,
+            )
+        queryset = queryset.order_by("price", "id")
+    if favorites_of:
+        queryset = queryset.filter(Exists(Favorite.objects.filter(product=OuterRef("pk"), user=favorites_of)))
+    if search_query:
+        queryset = search_products(queryset, search_query)
+    return queryset
+
+
+def user_overlay(buyer, product_ids):
+    """Количество в корзине {product_id: count} и множество id избранных товаров для страницы."""
+    if not buyer or not product_ids:
+        return {}, set()
+    cart_counts = dict(
+        Cart.objects.filter(user=buyer, product_id__in=product_ids).values_list("product_id", "count")
+    )
+    favorite_ids = set(
+        Favorite.objects.filter(user=buyer, product_id__in=product_ids).values_list("product_id", flat=True)
+    )
+    return cart_counts, favorite_ids
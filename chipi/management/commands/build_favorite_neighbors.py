@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chipi import recommendations, similarity
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие товары по избранному покупателей (нужны numpy и scipy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-k', type=int, default=recommendations.NEIGHBORS_K, help='соседей на товар')
+        parser.add_argument('--with-cart', action='store_true', help='учитывать и товары в корзинах')
+        parser.add_argument('--chunk-size', type=int, default=similarity.CHUNK_SIZE,
+                            help='товаров в одном куске произведения матриц')
+
+    def handle(self, *args, **options):
+        try:
+            count = similarity.build_favorite_neighbors(options['with_cart'], options['k'], options['chunk_size'])
+        except ImportError as e:
+            raise CommandError(f'Для расчёта нужны numpy и scipy: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Записей о соседях: {count}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from chipi import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает блок "С этим товаром покупают" по счётчикам совместных покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-k', type=int, default=recommendations.NEIGHBORS_K, help='соседей на товар')
+        parser.add_argument('--min-count', type=int, default=recommendations.MIN_PAIR_COUNT,
+                            help='минимум совместных покупок')
+
+    def handle(self, *args, **options):
+        count = recommendations.build_bought_neighbors(options['k'], options['min_count'])
+        self.stdout.write(self.style.SUCCESS(f'Записей о соседях: {count}'))
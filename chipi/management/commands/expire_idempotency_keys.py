@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from chipi import idempotency
+
+
+class Command(BaseCommand):
+    help = 'Удаляет истёкшие ключи идемпотентности (запускать периодически, например из cron)'
+
+    def handle(self, *args, **options):
+        count = idempotency.expire_keys()
+        self.stdout.write(self.style.SUCCESS(f'Удалено ключей: {count}'))
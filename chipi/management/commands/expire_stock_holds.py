@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from chipi import reservations
+
+
+class Command(BaseCommand):
+    help = 'Удаляет истёкшие резервы товаров (запускать периодически, например из cron)'
+
+    def handle(self, *args, **options):
+        count = reservations.expire_holds()
+        self.stdout.write(self.style.SUCCESS(f'Удалено резервов: {count}'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from chipi import mining
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает правила "с этим товаром покупают" (FP-Growth по всем заказам)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-support', type=float, default=mining.MIN_SUPPORT,
+                            help='минимальная доля заказов с набором товаров')
+        parser.add_argument('--min-confidence', type=float, default=mining.MIN_CONFIDENCE,
+                            help='минимальная достоверность правила')
+        parser.add_argument('--max-length', type=int, default=mining.MAX_LENGTH,
+                            help='максимальное число товаров в наборе')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='число процессов; покупки делятся между ними по группам товаров')
+
+    def handle(self, *args, **options):
+        orders, itemsets, rules = mining.mine_rules(
+            options['min_support'], options['min_confidence'], options['max_length'], options['workers']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Заказов: {orders}, частых наборов: {itemsets}, правил: {rules}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from chipi import search
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает полнотекстовый индекс товаров'
+
+    def handle(self, *args, **options):
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано товаров: {count}'))
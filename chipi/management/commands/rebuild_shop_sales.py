@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from chipi import analytics
+from chipi.models import Shop
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводку продаж магазинов по дням из строк заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, help='id магазина (по умолчанию все)')
+
+    def handle(self, *args, **options):
+        shop = Shop.objects.get(pk=options['shop']) if options['shop'] else None
+        count = analytics.rebuild_sales(shop)
+        self.stdout.write(self.style.SUCCESS(f'Строк сводки: {count}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from chipi import ratings
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинги товаров по отзывам'
+
+    def handle(self, *args, **options):
+        count = ratings.recalculate_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Обновлено товаров: {count}'))
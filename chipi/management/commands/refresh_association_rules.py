@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from chipi import mining
+
+
+class Command(BaseCommand):
+    help = 'Сжимает счётчики пар товаров и пересчитывает правила для изменившихся пар (запускать каждые несколько минут)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='сначала пересчитать счётчики по всем заказам')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            orders = mining.rebuild_counters()
+            self.stdout.write(f'Счётчики пересчитаны по {orders} заказам')
+        pruned = mining.prune_pairs()
+        refreshed = mining.refresh_pair_rules()
+        self.stdout.write(self.style.SUCCESS(f'Удалено редких пар: {pruned}, пересчитано пар: {refreshed}'))
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# SQL зафиксирован здесь, а не берётся из chipi.search, чтобы правки модуля не меняли историю миграций
+FTS_TABLE = 'chipi_product_fts'
+
+
+def forwards(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(title, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, description) "
+            f"SELECT id, replace(replace(title, 'ё', 'е'), 'Ё', 'Е'), "
+            f"replace(replace(description, 'ё', 'е'), 'Ё', 'Е') FROM chipi_product"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+
+def backwards(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipi', '0019_alter_product_category'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
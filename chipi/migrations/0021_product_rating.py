@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:36
+
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def backfill_ratings(apps, schema_editor):
+    # Пересчёт по отзывам повторяет chipi.ratings на момент миграции и не зависит от него
+    Product = apps.get_model('chipi', 'Product')
+    Review = apps.get_model('chipi', 'Review')
+
+    def count_reviews(**filters):
+        counts = (
+            Review.objects.filter(product=OuterRef('pk'), **filters)
+            .values('product')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return Coalesce(Subquery(counts), 0)
+
+    Product.objects.update(
+        rating_count=count_reviews(),
+        **{f'rating_{score}': count_reviews(score=score) for score in range(1, 6)},
+    )
+    stars = Value(0)
+    for score in range(1, 6):
+        stars = stars + score * F(f'rating_{score}')
+    Product.objects.update(
+        rating_avg=Coalesce(Cast(stars, FloatField()) / NullIf(F('rating_count'), 0), Value(0.0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipi', '0020_product_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipi', '0021_product_rating'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prodcategory',
+            index=models.Index(fields=['tree_id', 'lft'], name='chipi_prodcat_tree_lft_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['prodcategory', 'price'], name='chipi_product_cat_price_idx'),
+        ),
+    ]
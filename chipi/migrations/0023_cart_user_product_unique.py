@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:41
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_carts(apps, schema_editor):
+    Cart = apps.get_model('chipi', 'Cart')
+    duplicates = (
+        Cart.objects.values('user_id', 'product_id')
+        .annotate(lines=Count('id'), total=Sum('count'), keep=Min('id'))
+        .filter(lines__gt=1)
+    )
+    for row in duplicates:
+        lines = Cart.objects.filter(user_id=row['user_id'], product_id=row['product_id'])
+        lines.exclude(pk=row['keep']).delete()
+        lines.filter(pk=row['keep']).update(count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipi', '0022_category_scoping_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_carts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='chipi_cart_user_product_uniq'),
+        ),
+    ]
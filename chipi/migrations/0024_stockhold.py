@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipi', '0023_cart_user_product_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to='chipi.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_holds', to='users.buyer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'expires_at'], name='chipi_stockhold_product_idx'), models.Index(fields=['expires_at'], name='chipi_stockhold_expires_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'product'), name='chipi_stockhold_user_product_uniq')],
+            },
+        ),
+    ]
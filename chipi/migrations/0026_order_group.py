@@ -0,0 +1,155 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+ADDRESS_FIELDS = [
+    "first_name", "middle_name", "last_name", "email", "phone",
+    "country", "region", "city", "index", "addr",
+]
+
+# строки одного покупателя с одним адресом, созданные с разницей не больше минуты, считаются одним заказом
+GROUP_GAP_SECONDS = 60
+
+
+# заказов, которые создаются и привязываются к строкам за один проход
+GROUP_BATCH_SIZE = 500
+
+
+def group_orders(apps, schema_editor):
+    Order = apps.get_model("chipi", "Order")
+    OrderGroup = apps.get_model("chipi", "OrderGroup")
+
+    # в памяти только текущий заказ и пачка из GROUP_BATCH_SIZE заказов с id их строк
+    batch = []
+
+    def flush():
+        groups = OrderGroup.objects.bulk_create([group for group, _, _ in batch])
+        # time_created с auto_now_add перезаписывается при вставке, поэтому ставится вторым запросом
+        for group, (_, time_created, _) in zip(groups, batch):
+            group.time_created = time_created
+        OrderGroup.objects.bulk_update(groups, ["time_created"])
+        lines = [
+            Order(pk=line_id, group_id=group.pk)
+            for group, (_, _, line_ids) in zip(groups, batch)
+            for line_id in line_ids
+        ]
+        Order.objects.bulk_update(lines, ["group"], batch_size=GROUP_BATCH_SIZE)
+        batch.clear()
+
+    def add(first, total, line_ids):
+        group = OrderGroup(user_id=first.user_id, total=total, **{f: getattr(first, f) for f in ADDRESS_FIELDS})
+        batch.append((group, first.time_created, line_ids))
+        if len(batch) >= GROUP_BATCH_SIZE:
+            flush()
+
+    lines = Order.objects.order_by("user_id", "time_created", "id").only(
+        "user_id", "time_created", "price", "count", *ADDRESS_FIELDS
+    )
+    key = last_time = first = None
+    total, line_ids = 0, []
+    for order in lines.iterator(chunk_size=2000):
+        order_key = (order.user_id, *[getattr(order, f) for f in ADDRESS_FIELDS])
+        if (
+            order_key != key
+            or (order.time_created - last_time).total_seconds() > GROUP_GAP_SECONDS
+        ):
+            if first is not None:
+                add(first, total, line_ids)
+            key, first, total, line_ids = order_key, order, 0, []
+        total += order.price * order.count
+        line_ids.append(order.pk)
+        last_time = order.time_created
+    if first is not None:
+        add(first, total, line_ids)
+    if batch:
+        flush()
+
+
+def ungroup_orders(apps, schema_editor):
+    Order = apps.get_model("chipi", "Order")
+    OrderGroup = apps.get_model("chipi", "OrderGroup")
+
+    for group in OrderGroup.objects.iterator(chunk_size=2000):
+        Order.objects.filter(group=group).update(
+            user_id=group.user_id,
+            **{f: getattr(group, f) for f in ADDRESS_FIELDS},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipi', '0025_idempotencykey'),
+        ('users', '0015_alter_address_middle_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time_created', models.DateTimeField(auto_now_add=True)),
+                ('total', models.PositiveBigIntegerField(default=0)),
+                ('card_last4', models.CharField(blank=True, max_length=4)),
+                ('first_name', models.CharField(max_length=63)),
+                ('middle_name', models.CharField(blank=True, max_length=63)),
+                ('last_name', models.CharField(max_length=63)),
+                ('email', models.EmailField(max_length=254)),
+                ('phone', models.CharField()),
+                ('country', models.CharField()),
+                ('region', models.CharField()),
+                ('city', models.CharField()),
+                ('index', models.CharField()),
+                ('addr', models.CharField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_groups', to='users.buyer')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='group',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='chipi.ordergroup'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='users.buyer'),
+        ),
+        migrations.RunPython(group_orders, ungroup_orders),
+        # только для отката: удалённые колонки вернутся с пустыми значениями, а ungroup_orders их заполнит
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='order',
+                    name=name,
+                    field=field,
+                )
+                for name, field in [
+                    ('first_name', models.CharField(default='', max_length=63)),
+                    ('middle_name', models.CharField(blank=True, default='', max_length=63)),
+                    ('last_name', models.CharField(default='', max_length=63)),
+                    ('email', models.EmailField(default='', max_length=254)),
+                    ('phone', models.CharField(default='')),
+                    ('country', models.CharField(default='')),
+                    ('region', models.CharField(default='')),
+                    ('city', models.CharField(default='')),
+                    ('index', models.CharField(default='')),
+                    ('addr', models.CharField(default='')),
+                ]
+            ],
+        ),
+        migrations.RemoveField(model_name='order', name='user'),
+        migrations.RemoveField(model_name='order', name='first_name'),
+        migrations.RemoveField(model_name='order', name='middle_name'),
+        migrations.RemoveField(model_name='order', name='last_name'),
+        migrations.RemoveField(model_name='order', name='email'),
+        migrations.RemoveField(model_name='order', name='phone'),
+        migrations.RemoveField(model_name='order', name='country'),
+        migrations.RemoveField(model_name='order', name='region'),
+        migrations.RemoveField(model_name='order', name='city'),
+        migrations.RemoveField(model_name='order', name='index'),
+        migrations.RemoveField(model_name='order', name='addr'),
+        migrations.AlterField(
+            model_name='order',
+            name='group',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='chipi.ordergroup'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipi', '0026_order_group'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['shop', '-time_created', '-id'], name='chipi_order_shop_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['shop', 'status', '-time_created', '-id'], name='chipi_order_shop_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['group', 'status'], name='chipi_order_group_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordergroup',
+            index=models.Index(fields=['user', '-time_created', '-id'], name='chipi_ordergroup_user_time_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipi', '0027_order_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.IntegerField(choices=[(0, 'Создан'), (1, 'Оплачен'), (2, 'В сборке'), (3, 'В пути'), (4, 'Ожидает выдачи'), (5, 'Доставлен')])),
+                ('time_changed', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_history', to='chipi.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order', 'time_changed'], name='chipi_orderhistory_order_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipi', '0028_order_status_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('revenue', models.BigIntegerField(default=0)),
+                ('units', models.BigIntegerField(default=0)),
+                ('orders', models.BigIntegerField(default=0)),
+                ('delivered_revenue', models.BigIntegerField(default=0)),
+                ('delivered_units', models.BigIntegerField(default=0)),
+                ('product', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_sales', to='chipi.product')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='chipi.shop')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shop', 'day'], name='chipi_shopsales_shop_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('shop', 'product', 'day'), name='chipi_shopsales_shop_product_day_uniq')],
+            },
+        ),
+    ]
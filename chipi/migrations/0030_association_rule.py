@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipi', '0029_shop_daily_sales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssociationRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('antecedent', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField()),
+                ('support', models.FloatField()),
+                ('confidence', models.FloatField()),
+                ('lift', models.FloatField()),
+                ('consequent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chipi.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['antecedent', '-confidence'], name='chipi_rule_antecedent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('antecedent', 'consequent'), name='chipi_rule_antecedent_consequent_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipi', '0030_association_rule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemCount',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='chipi.product')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('dirty', models.BooleanField(default=True)),
+                ('time_updated', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('dirty', True)), fields=['product'], name='chipi_itemcount_dirty_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PairCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('dirty', models.BooleanField(default=True)),
+                ('time_updated', models.DateTimeField()),
+                ('item_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chipi.product')),
+                ('item_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chipi.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item_b'], name='chipi_paircount_item_b_idx'), models.Index(condition=models.Q(('dirty', True)), fields=['item_a', 'item_b'], name='chipi_paircount_dirty_idx')],
+                'constraints': [models.UniqueConstraint(fields=('item_a', 'item_b'), name='chipi_paircount_items_uniq')],
+            },
+        ),
+    ]
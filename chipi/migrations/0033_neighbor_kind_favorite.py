@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipi', '0032_product_neighbor'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productneighbor',
+            name='kind',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Покупают вместе'), (1, 'Добавляют в избранное вместе')], default=0),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipi', '0033_neighbor_kind_favorite'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='itemcount',
+            index=models.Index(fields=['-count'], name='chipi_itemcount_count_idx'),
+        ),
+    ]
@@ -0,0 +1,230 @@
+import math
+from collections import Counter
+from datetime import timedelta
+from itertools import combinations
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import fpgrowth
+from .models import AssociationRule, ItemCount, Order, PairCount
+
+MIN_SUPPORT = 0.001
+MIN_CONFIDENCE = 0.1
+MAX_LENGTH = 3
+LOAD_CHUNK_SIZE = 5000
+SAVE_BATCH_SIZE = 2000
+# пар в одном пересчёте правил: условие удаления старых правил растёт с пачкой
+PAIR_BATCH_SIZE = 200
+# строк в одном upsert счётчиков, чтобы не упереться в лимит параметров запроса
+BUMP_BATCH_SIZE = 100
+# пары считаются только для корзин не больше этого размера: их число растёт квадратично,
+# а upsert идёт в транзакции оплаты
+MAX_PAIR_BASKET = 20
+
+# при сжатии удаляются редкие пары, которые давно не встречались
+PRUNE_MAX_COUNT = 1
+PRUNE_AGE = timedelta(days=30)
+
+ITEM_BUMP_SQL = """
+    INSERT INTO chipi_itemcount (product_id, count, dirty, time_updated)
+    VALUES %s
+    ON CONFLICT (product_id) DO UPDATE
+    SET count = chipi_itemcount.count + excluded.count, dirty = excluded.dirty, time_updated = excluded.time_updated
+"""
+
+PAIR_BUMP_SQL = """
+    INSERT INTO chipi_paircount (item_a_id, item_b_id, count, dirty, time_updated)
+    VALUES %s
+    ON CONFLICT (item_a_id, item_b_id) DO UPDATE
+    SET count = chipi_paircount.count + excluded.count, dirty = excluded.dirty, time_updated = excluded.time_updated
+"""
+
+
+def itemset_key(items):
+    """Набор товаров в виде строки AssociationRule.antecedent: id по возрастанию через запятую."""
+    return ",".join(str(item) for item in sorted(items))
+
+
+def load_transactions():
+    """Покупки: товары строк одного OrderGroup (одного оформления заказа)."""
+    lines = (
+        Order.objects.filter(product__isnull=False)
+        .order_by("group_id")
+        .values_list("group_id", "product_id")
+    )
+    transactions = []
+    current = None
+    for group_id, product_id in lines.iterator(chunk_size=LOAD_CHUNK_SIZE):
+        if group_id != current:
+            current = group_id
+            transactions.append(set())
+        transactions[-1].add(product_id)
+    return transactions
+
+
+def count_transactions():
+    """Число покупок так же, как их видит load_transactions: заказы хотя бы с одним товаром."""
+    return Order.objects.filter(product__isnull=False).values("group_id").distinct().count()
+
+
+def basket_pairs(items):
+    """Пары товаров корзины (a < b); для корзин больше MAX_PAIR_BASKET пар нет."""
+    if len(items) > MAX_PAIR_BASKET:
+        return []
+    return combinations(items, 2)
+
+
+def save_rules(rules):
+    """Заменяет все правила новыми. Возвращает их количество."""
+    saved = 0
+    with transaction.atomic():
+        AssociationRule.objects.all().delete()
+        batch = []
+        for antecedent, consequent, count, support, confidence, lift in rules:
+            batch.append(AssociationRule(
+                antecedent=itemset_key(antecedent),
+                consequent_id=consequent,
+                count=count,
+                support=support,
+                confidence=confidence,
+                lift=lift,
+            ))
+            if len(batch) >= SAVE_BATCH_SIZE:
+                saved += len(AssociationRule.objects.bulk_create(batch))
+                batch = []
+        saved += len(AssociationRule.objects.bulk_create(batch))
+    return saved
+
+
+def mine_rules(min_support=MIN_SUPPORT, min_confidence=MIN_CONFIDENCE, max_length=MAX_LENGTH, workers=1):
+    """Полный пересчёт правил FP-Growth по всем заказам.
+
+    min_support - доля заказов, в которых должен встречаться набор,
+    min_confidence - минимальная доля заказов с antecedent, где есть и consequent.
+    Возвращает (число заказов, число частых наборов, число правил).
+    """
+    transactions = load_transactions()
+    if not transactions:
+        return 0, 0, save_rules([])
+
+    min_count = max(2, math.ceil(min_support * len(transactions)))
+    itemsets = fpgrowth.frequent_itemsets(transactions, min_count, max_length, workers)
+    rules = fpgrowth.association_rules(itemsets, len(transactions), min_confidence)
+    return len(transactions), len(itemsets), save_rules(rules)
+
+
+def bump_counts(sql, rows):
+    if not rows:
+        return
+    placeholder = "(%s)" % ", ".join(["%s"] * len(rows[0]))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), BUMP_BATCH_SIZE):
+            batch = rows[start:start + BUMP_BATCH_SIZE]
+            cursor.execute(sql % ", ".join([placeholder] * len(batch)), [value for row in batch for value in row])
+
+
+def record_basket(product_ids):
+    """Учитывает покупку в счётчиках товаров и пар (вызывается при оплате в той же транзакции)."""
+    items = sorted(set(product_ids))
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    bump_counts(ITEM_BUMP_SQL, [(item, 1, True, now) for item in items])
+    bump_counts(PAIR_BUMP_SQL, [(a, b, 1, True, now) for a, b in basket_pairs(items)])
+
+
+def rebuild_counters():
+    """Пересчитывает счётчики товаров и пар по всем заказам. Возвращает число заказов."""
+    transactions = load_transactions()
+    item_counts = Counter()
+    pair_counts = Counter()
+    for items in transactions:
+        items = sorted(items)
+        item_counts.update(items)
+        pair_counts.update(basket_pairs(items))
+
+    now = timezone.now()
+    with transaction.atomic():
+        PairCount.objects.all().delete()
+        ItemCount.objects.all().delete()
+        ItemCount.objects.bulk_create(
+            (ItemCount(product_id=item, count=count, time_updated=now) for item, count in item_counts.items()),
+            batch_size=SAVE_BATCH_SIZE,
+        )
+        PairCount.objects.bulk_create(
+            (PairCount(item_a_id=a, item_b_id=b, count=count, time_updated=now) for (a, b), count in pair_counts.items()),
+            batch_size=SAVE_BATCH_SIZE,
+        )
+    return len(transactions)
+
+
+def prune_pairs(now=None):
+    """Сжатие: удаляет пары, встретившиеся не больше PRUNE_MAX_COUNT раз и давно не обновлявшиеся."""
+    now = now or timezone.now()
+    deleted, _ = PairCount.objects.filter(count__lte=PRUNE_MAX_COUNT, time_updated__lt=now - PRUNE_AGE).delete()
+    return deleted
+
+
+def refresh_pair_rules(min_support=MIN_SUPPORT, min_confidence=MIN_CONFIDENCE):
+    """Пересчитывает правила "товар -> товар" только для изменившихся счётчиков.
+
+    Затрагиваются пары с новыми покупками и пары, у которых изменился
+    счётчик одного из товаров. Правила с наборами из нескольких товаров
+    обновляет только полный пересчёт mine_rules. Возвращает число
+    пересчитанных пар.
+    """
+    started = timezone.now()
+    total = count_transactions()
+    if not total:
+        return 0
+    min_count = max(2, math.ceil(min_support * total))
+
+    dirty_items = ItemCount.objects.filter(dirty=True).values("product_id")
+    pairs = PairCount.objects.filter(
+        Q(dirty=True) | Q(item_a__in=dirty_items) | Q(item_b__in=dirty_items)
+    ).values_list("item_a_id", "item_b_id", "count")
+
+    refreshed = 0
+    batch = []
+    for pair in pairs.iterator(chunk_size=SAVE_BATCH_SIZE):
+        batch.append(pair)
+        if len(batch) >= PAIR_BATCH_SIZE:
+            refreshed += save_pair_rules(batch, total, min_count, min_confidence)
+            batch = []
+    refreshed += save_pair_rules(batch, total, min_count, min_confidence)
+
+    PairCount.objects.filter(dirty=True, time_updated__lte=started).update(dirty=False)
+    ItemCount.objects.filter(dirty=True, time_updated__lte=started).update(dirty=False)
+    return refreshed
+
+
+def save_pair_rules(pairs, total, min_count, min_confidence):
+    """Заменяет правила a -> b и b -> a для пачки пар [(a, b, count)]."""
+    if not pairs:
+        return 0
+    items = {a for a, _, _ in pairs} | {b for _, b, _ in pairs}
+    item_counts = dict(ItemCount.objects.filter(product_id__in=items).values_list("product_id", "count"))
+
+    stale = Q()
+    rules = []
+    for a, b, count in pairs:
+        for antecedent, consequent in ((a, b), (b, a)):
+            stale |= Q(antecedent=str(antecedent), consequent_id=consequent)
+            if count < min_count or not item_counts.get(antecedent) or not item_counts.get(consequent):
+                continue
+            confidence = count / item_counts[antecedent]
+            if confidence < min_confidence:
+                continue
+            rules.append(AssociationRule(
+                antecedent=str(antecedent),
+                consequent_id=consequent,
+                count=count,
+                support=count / total,
+                confidence=confidence,
+                lift=confidence * total / item_counts[consequent],
+            ))
+
+    with transaction.atomic():
+        AssociationRule.objects.filter(stale).delete()
+        AssociationRule.objects.bulk_create(rules)
+    return len(pairs)
@@ -11,6 +11,10 @@ from users.models import User, Buyer
 # from users.models import User
 # Create your models here.
 
+# Агрегаты отзывов меняются только через F()-UPDATE в chipi.ratings
+RATING_FIELDS = ['rating_avg', 'rating_count', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+
+
 class Product(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
@@ -23,10 +27,20 @@ class Product(models.Model):
     time_updated = models.DateTimeField(auto_now=True)
     is_published = models.BooleanField(default=True)
     logo_image = models.ImageField(upload_to='logos/')
+    rating_avg = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
 
     def get_absolute_url(self):
         return reverse('product', kwargs={'product_id': self.pk})
 
+    def rating_histogram(self):
+        return {score: getattr(self, f'rating_{score}') for score in range(1, 6)}
+
     def save(self, *args, **kwargs):
         try:
             this = Product.objects.get(id=self.id)
@@ -36,6 +50,12 @@ class Product(models.Model):
         except:
             pass
 
+        # Сохранение формы не должно затирать рейтинг, обновлённый отзывами после загрузки товара
+        if not self._state.adding and not args and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in RATING_FIELDS
+            ]
         super(Product, self).save(*args, **kwargs)
 
     # def __str__(self):
@@ -43,6 +63,9 @@ class Product(models.Model):
 
     class Meta:
         ordering = ["pk"]
+        indexes = [
+            models.Index(fields=['prodcategory', 'price'], name='chipi_product_cat_price_idx'),
+        ]
 
 
 class ProductImage(models.Model):
@@ -61,6 +84,9 @@ class ProdCategory(MPTTModel):
 
     class Meta:
         unique_together = [['parent', 'slug']]
+        indexes = [
+            models.Index(fields=['tree_id', 'lft'], name='chipi_prodcat_tree_lft_idx'),
+        ]
         verbose_name = 'Категория'
         verbose_name_plural = 'Категории'
 
@@ -121,6 +147,11 @@ class Cart(models.Model):
     def sum(self):
         return self.count * self.product.price
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='chipi_cart_user_product_uniq'),
+        ]
+
 
 class Favorite(models.Model):
     user = models.ForeignKey(Buyer, on_delete=models.CASCADE, related_name='favorite')
@@ -131,7 +162,32 @@ class Favorite(models.Model):
         ordering = ["-time_created"]
 
 
+class OrderGroup(models.Model):
+    '''Заказ: покупатель, адрес доставки и оплата, общие для всех строк'''
+    user = models.ForeignKey(Buyer, on_delete=models.CASCADE, related_name='order_groups')
+    time_created = models.DateTimeField(auto_now_add=True)
+    total = models.PositiveBigIntegerField(default=0)
+    card_last4 = models.CharField(max_length=4, blank=True)
+
+    first_name = models.CharField(max_length=63)
+    middle_name = models.CharField(max_length=63, blank=True)
+    last_name = models.CharField(max_length=63)
+    email = models.EmailField()
+    phone = models.CharField()
+    country = models.CharField()
+    region = models.CharField()
+    city = models.CharField()
+    index = models.CharField()
+    addr = models.CharField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-time_created', '-id'], name='chipi_ordergroup_user_time_idx'),
+        ]
+
+
 class Order(models.Model):
+    '''Строка заказа: товар одного магазина, статус и трек-номер ведёт магазин'''
     class Status(models.IntegerChoices):
         CREATED = 0, 'Создан'
         PAID_FOR = 1, 'Оплачен'
@@ -139,8 +195,7 @@ class Order(models.Model):
         TRANSIT = 3, 'В пути'
         WAITING = 4, 'Ожидает выдачи'
         DELIVERED = 5, 'Доставлен'
-    '''+ address'''
-    user = models.ForeignKey(Buyer, on_delete=models.CASCADE, related_name='orders')
+    group = models.ForeignKey(OrderGroup, on_delete=models.CASCADE, related_name='lines')
     shop = models.ForeignKey(Shop, on_delete=models.SET_NULL, related_name='orders', null=True)
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, related_name='orders', null=True)
     count = models.PositiveIntegerField()
@@ -150,13 +205,143 @@ class Order(models.Model):
     title = models.CharField(max_length=255)
     track = models.CharField(blank=True)
 
-    first_name = models.CharField(max_length=63)
-    middle_name = models.CharField(max_length=63, blank=True)
-    last_name = models.CharField(max_length=63)
-    email = models.EmailField()
-    phone = models.CharField()
-    country = models.CharField()
-    region = models.CharField()
-    city = models.CharField()
-    index = models.CharField()
-    addr = models.CharField()
+    class Meta:
+        indexes = [
+            models.Index(fields=['shop', '-time_created', '-id'], name='chipi_order_shop_time_idx'),
+            models.Index(fields=['shop', 'status', '-time_created', '-id'], name='chipi_order_shop_status_idx'),
+            models.Index(fields=['group', 'status'], name='chipi_order_group_status_idx'),
+        ]
+
+
+class OrderStatusHistory(models.Model):
+    '''История смены статусов строки заказа'''
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_history')
+    status = models.IntegerField(choices=Order.Status.choices)
+    time_changed = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'time_changed'], name='chipi_orderhistory_order_idx'),
+        ]
+
+
+class StockHold(models.Model):
+    '''Резерв товара на время оформления заказа'''
+    user = models.ForeignKey(Buyer, on_delete=models.CASCADE, related_name='stock_holds')
+    product = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='stock_holds')
+    count = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='chipi_stockhold_user_product_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'expires_at'], name='chipi_stockhold_product_idx'),
+            models.Index(fields=['expires_at'], name='chipi_stockhold_expires_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    '''Сохранённый ответ на запрос с ключом идемпотентности'''
+    # sha256 от пользователя, адреса запроса и ключа клиента
+    key = models.CharField(max_length=64, primary_key=True)
+    # sha256 от полей запроса: тот же ключ с другими данными - ошибка клиента
+    request_hash = models.CharField(max_length=64, blank=True)
+    # 0 - запрос ещё выполняется
+    status_code = models.PositiveSmallIntegerField(default=0)
+    content_type = models.CharField(max_length=100, blank=True)
+    location = models.CharField(max_length=255, blank=True)
+    body = models.BinaryField(blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+
+class ShopDailySales(models.Model):
+    '''Продажи магазина по товару за день: счётчики, которые увеличиваются при оплате и смене статуса'''
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name='daily_sales')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, related_name='daily_sales', null=True)
+    day = models.DateField()
+    revenue = models.BigIntegerField(default=0)
+    units = models.BigIntegerField(default=0)
+    orders = models.BigIntegerField(default=0)
+    delivered_revenue = models.BigIntegerField(default=0)
+    delivered_units = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'product', 'day'], name='chipi_shopsales_shop_product_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['shop', 'day'], name='chipi_shopsales_shop_day_idx'),
+        ]
+
+
+class AssociationRule(models.Model):
+    '''Правило "с этими товарами покупают": набор antecedent -> товар consequent'''
+    # id товаров набора по возрастанию через запятую, например "12,45"
+    antecedent = models.CharField(max_length=255)
+    consequent = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    # в скольких заказах встречаются все товары правила
+    count = models.PositiveIntegerField()
+    support = models.FloatField()
+    confidence = models.FloatField()
+    lift = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['antecedent', 'consequent'], name='chipi_rule_antecedent_consequent_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['antecedent', '-confidence'], name='chipi_rule_antecedent_idx'),
+        ]
+
+
+class ItemCount(models.Model):
+    '''В скольких заказах встречается товар (для пересчёта правил без чтения Order)'''
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+    # изменился после последнего пересчёта правил
+    dirty = models.BooleanField(default=True)
+    time_updated = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product'], condition=models.Q(dirty=True), name='chipi_itemcount_dirty_idx'),
+            models.Index(fields=['-count'], name='chipi_itemcount_count_idx'),
+        ]
+
+
+class PairCount(models.Model):
+    '''В скольких заказах товары встречаются вместе; item_a < item_b'''
+    item_a = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    item_b = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+    dirty = models.BooleanField(default=True)
+    time_updated = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item_a', 'item_b'], name='chipi_paircount_items_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['item_b'], name='chipi_paircount_item_b_idx'),
+            models.Index(fields=['item_a', 'item_b'], condition=models.Q(dirty=True), name='chipi_paircount_dirty_idx'),
+        ]
+
+
+class ProductNeighbor(models.Model):
+    '''Похожий товар из заранее посчитанного списка top-K для товара'''
+    class Kind(models.IntegerChoices):
+        BOUGHT = 0, 'Покупают вместе'
+        FAVORITE = 1, 'Добавляют в избранное вместе'
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    neighbor = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    kind = models.PositiveSmallIntegerField(choices=Kind.choices, default=Kind.BOUGHT)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'kind', 'rank'], name='chipi_neighbor_product_kind_rank_uniq'),
+        ]
@@ -1,3 +1,10 @@
+import json
+import random
+import time
+from collections import Counter
+from itertools import combinations
+from datetime import timedelta
+
 from django.urls import reverse
 import pytest
 import django
@@ -6,9 +13,27 @@ import os
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'market.settings')
 django.setup()
 from django.contrib.auth.models import AnonymousUser
+from django.db import connection
 from django.test import Client
+from django.utils import timezone
 from users.models import Address, User, Buyer
-from .models import Order, Product, Cart
+from .models import ProdCategory, ItemCount, Order, Product, Cart, Shop, Category, Review, Favorite, AssociationRule, IdempotencyKey, PairCount, ProductNeighbor, OrderStatusHistory, ShopDailySales, StockHold
+from . import fpgrowth
+from .analytics import rebuild_sales
+from .categories import category_tree_html
+from .cart import add_to_cart, cart_lines, cart_summary, cart_totals, reconcile_carts, remove_from_cart
+from .listing import product_listing, user_overlay
+from .mining import MAX_PAIR_BASKET, mine_rules, refresh_pair_rules
+from .orders import ORDERS_ORDERING, StockChanged, place_order, shop_order_lines, update_orders
+from .pagination import encode_cursor, keyset_page
+from .ranking import personal_feed, rank_products
+from .ratings import recalculate_ratings
+from .recommendations import build_bought_neighbors, neighbors_cache, product_neighbors
+from . import reservations
+from .idempotency import make_key
+from .reservations import available_stock, expire_holds, hold_cart
+from .search import rebuild_index, search_products
+from .similarity import favorite_neighbors
 
 
 @pytest.fixture
@@ -87,3 +112,760 @@ def test_pay_order_with_insufficient_stock(self):
     response = self.client.post(reverse("pay_order"), {"payment_method": "card"})
     self.assertRedirects(response, reverse("pay_order"))  
     self.assertContains(response, "Количество доступных товаров изменилось")
+
+
+@pytest.fixture
+def shop(db):
+    return Shop.objects.create(name="Test Shop")
+
+
+@pytest.fixture
+def category(db):
+    return Category.objects.create(name="Test Category", slug="test-category")
+
+
+def test_search_matches_description_and_word_forms(shop, category):
+    phone = Product.objects.create(title="Красный телефон", description="Смартфон", price=100, shop=shop, category=category)
+    case = Product.objects.create(title="Чехол", description="Подходит для телефонов", price=10, shop=shop, category=category)
+    Product.objects.create(title="Ёлка", price=10, shop=shop, category=category)
+
+    found = list(search_products(Product.objects.all(), "телефоны"))
+
+    assert found == [phone, case]
+    assert list(search_products(Product.objects.all(), "елки"))[0].title == "Ёлка"
+
+
+def test_search_index_follows_product_changes(shop, category):
+    product = Product.objects.create(title="Чайник", price=100, shop=shop, category=category)
+    product.title = "Кофеварка"
+    product.save()
+
+    assert not search_products(Product.objects.all(), "чайник").exists()
+    assert search_products(Product.objects.all(), "кофеварка").exists()
+
+    product.delete()
+    assert not search_products(Product.objects.all(), "кофеварка").exists()
+
+
+def test_keyset_page_walks_all_products_once(shop, category):
+    for i in range(7):
+        Product.objects.create(title=f"Товар {i}", price=100 - i % 3, shop=shop, category=category)
+
+    seen = []
+    cursor = None
+    while True:
+        page = keyset_page(Product.objects.all(), cursor, ordering=["price"], per_page=3)
+        seen.extend(p.pk for p in page)
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+
+    expected = list(Product.objects.order_by("price", "id").values_list("pk", flat=True))
+    assert seen == expected
+
+
+def test_product_rating_follows_reviews(shop, category, buyer):
+    product = Product.objects.create(title="Товар", price=100, shop=shop, category=category)
+    other = Buyer.objects.create(user=User.objects.create_user(username="other", password="testpass"))
+    first = Review.objects.create(product=product, user=buyer, score=5)
+    Review.objects.create(product=product, user=other, score=2)
+
+    product.refresh_from_db()
+    assert (product.rating_count, product.rating_avg) == (2, 3.5)
+    assert product.rating_histogram() == {1: 0, 2: 1, 3: 0, 4: 0, 5: 1}
+
+    first.delete()
+    product.refresh_from_db()
+    assert (product.rating_count, product.rating_avg, product.rating_5) == (1, 2.0, 0)
+
+    Product.objects.filter(pk=product.pk).update(rating_count=0, rating_avg=0, rating_2=0)
+    recalculate_ratings()
+    product.refresh_from_db()
+    assert (product.rating_count, product.rating_avg, product.rating_2) == (1, 2.0, 1)
+
+
+def test_user_overlay_for_page(shop, category, buyer, django_assert_num_queries):
+    first, second, third = [
+        Product.objects.create(title=f"Товар {i}", price=100, count=5, shop=shop, category=category)
+        for i in range(3)
+    ]
+    Cart.objects.create(user=buyer, product=first, count=2)
+    Favorite.objects.create(user=buyer, product=second)
+
+    with django_assert_num_queries(2):
+        cart_counts, favorite_ids = user_overlay(buyer, [first.id, second.id, third.id])
+
+    assert cart_counts == {first.id: 2}
+    assert favorite_ids == {second.id}
+
+
+def test_cart_lines_and_totals_do_not_grow_with_cart(shop, category, buyer, django_assert_num_queries):
+    for i in range(5):
+        product = Product.objects.create(title=f"Товар {i}", price=100 + i, count=3, shop=shop, category=category)
+        Cart.objects.create(user=buyer, product=product, count=5 if i == 0 else 1)
+    Product.objects.filter(title="Товар 4").update(count=0)
+
+    # поиск расхождений, DELETE распроданных, UPDATE лишнего количества, выборка строк
+    with django_assert_num_queries(4):
+        carts = cart_lines(buyer)
+        assert [cart.product.shop.name for cart in carts] == ["Test Shop"] * 4
+    with django_assert_num_queries(1):
+        total_count, total_sum = cart_totals(buyer)
+
+    assert total_count == 3 + 1 + 1 + 1
+    assert total_sum == 3 * 100 + 101 + 102 + 103
+
+
+def test_add_to_cart_is_capped_by_stock(shop, category, buyer, django_assert_num_queries):
+    product = Product.objects.create(title="Товар", price=100, count=2, shop=shop, category=category)
+
+    with django_assert_num_queries(1):
+        assert add_to_cart(buyer, product.id) == (1, 2, True)
+    assert add_to_cart(buyer, product.id) == (2, 2, True)
+    assert add_to_cart(buyer, product.id) == (2, 2, False)
+    assert Cart.objects.filter(user=buyer, product=product).count() == 1
+
+    assert remove_from_cart(buyer, product.id) == 1
+    assert remove_from_cart(buyer, product.id) == 0
+    assert not Cart.objects.filter(user=buyer, product=product).exists()
+
+
+@pytest.fixture
+def address(db, buyer):
+    return Address.objects.create(
+        user=buyer, first_name="Vika", last_name="Kaz", phone="79149111111", email="test@example.com",
+        country="Russia", region="Moscow region", city="Moscow", addr="123 Test Street", index="123412",
+    )
+
+
+def test_place_order_is_all_or_nothing(shop, category, buyer, address, django_assert_max_num_queries):
+    first = Product.objects.create(title="Первый", price=100, count=5, shop=shop, category=category)
+    second = Product.objects.create(title="Второй", price=50, count=1, shop=shop, category=category)
+    Cart.objects.create(user=buyer, product=first, count=2)
+    Cart.objects.create(user=buyer, product=second, count=1)
+    carts = list(Cart.objects.filter(user=buyer).select_related("product__shop"))
+
+    Product.objects.filter(pk=second.pk).update(count=0)
+    with pytest.raises(StockChanged):
+        place_order(buyer, address, carts)
+    first.refresh_from_db()
+    assert first.count == 5
+    assert not Order.objects.exists()
+    assert Cart.objects.filter(user=buyer).count() == 2
+
+    Product.objects.filter(pk=second.pk).update(count=1)
+    with django_assert_max_num_queries(11):
+        group = place_order(buyer, address, carts)
+    assert [(o.title, o.count, o.price) for o in group.lines.order_by("pk")] == [("Первый", 2, 100), ("Второй", 1, 50)]
+    assert (group.user, group.total, group.city) == (buyer, 250, address.city)
+    assert list(Product.objects.order_by("pk").values_list("count", flat=True)) == [3, 0]
+    assert not Cart.objects.filter(user=buyer).exists()
+
+
+def test_stock_holds_block_other_buyers(shop, category, buyer, address):
+    product = Product.objects.create(title="Последний", price=100, count=3, shop=shop, category=category)
+    other = Buyer.objects.create(user=User.objects.create_user(username="other", password="testpass"))
+    Cart.objects.create(user=other, product=product, count=2)
+    assert hold_cart(other, list(Cart.objects.filter(user=other))) == {product.pk: 2}
+    assert available_stock([product.pk], buyer) == {product.pk: 1}
+    assert available_stock([product.pk], other) == {product.pk: 3}
+
+    Cart.objects.create(user=buyer, product=product, count=2)
+    carts = list(Cart.objects.filter(user=buyer).select_related("product__shop"))
+    assert hold_cart(buyer, carts) == {product.pk: 1}
+    with pytest.raises(StockChanged):
+        place_order(buyer, address, carts)
+
+    StockHold.objects.filter(user=other).update(expires_at=timezone.now())
+    assert expire_holds() == 1
+    place_order(buyer, address, carts)
+    product.refresh_from_db()
+    assert product.count == 1
+    assert not StockHold.objects.exists()
+
+
+def test_cart_batch_replays_by_idempotency_key(client, shop, category, buyer):
+    product = Product.objects.create(title="Товар", price=100, count=10, shop=shop, category=category)
+    User.objects.filter(pk=buyer.user_id).update(is_buyer=True)
+    client.force_login(buyer.user)
+    data = {"ops": json.dumps([{"product_id": product.pk, "delta": 2}])}
+
+    first = client.post(reverse("cart_batch"), data, HTTP_IDEMPOTENCY_KEY="retry-1")
+    second = client.post(reverse("cart_batch"), data, HTTP_IDEMPOTENCY_KEY="retry-1")
+    assert second["Idempotent-Replay"] == "true"
+    assert second.json() == first.json()
+    assert Cart.objects.get(user=buyer, product=product).count == 2
+
+    client.post(reverse("cart_batch"), data, HTTP_IDEMPOTENCY_KEY="retry-2")
+    assert Cart.objects.get(user=buyer, product=product).count == 4
+    assert IdempotencyKey.objects.count() == 2
+
+
+def test_show_orders_prefetches_lines(client, shop, category, buyer, address, django_assert_max_num_queries):
+    product = Product.objects.create(title="Товар", price=100, count=10, shop=shop, category=category)
+    for _ in range(3):
+        Cart.objects.create(user=buyer, product=product, count=1)
+        place_order(buyer, address, list(Cart.objects.filter(user=buyer).select_related("product__shop")))
+    User.objects.filter(pk=buyer.user_id).update(is_buyer=True)
+    client.force_login(buyer.user)
+
+    with django_assert_max_num_queries(8):
+        response = client.get(reverse("orders"))
+    assert len(response.context["groups"]) == 3
+    assert response.content.decode().count(address.addr) == 3
+
+
+def test_shop_orders_are_paginated_with_status_tabs(client, shop, category, buyer, address, django_assert_max_num_queries):
+    product = Product.objects.create(title="Товар", price=100, count=100, shop=shop, category=category)
+    for _ in range(25):
+        Cart.objects.create(user=buyer, product=product, count=1)
+        place_order(buyer, address, list(Cart.objects.filter(user=buyer).select_related("product__shop")))
+    Order.objects.filter(pk__in=Order.objects.order_by("pk").values("pk")[:5]).update(status=Order.Status.DELIVERED)
+    shop.user = User.objects.create_user(username="shopuser", password="testpass", is_shop=True)
+    shop.save()
+    client.force_login(shop.user)
+
+    with django_assert_max_num_queries(7):
+        response = client.get(reverse("orders_shop"))
+    first_page = response.context["orders"]
+    assert len(first_page) == 20
+    tabs = {tab["status"]: tab["count"] for tab in response.context["tabs"]}
+    assert tabs[Order.Status.CREATED] == 20 and tabs[Order.Status.DELIVERED] == 5
+
+    response = client.get(response.context["next_url"], HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+    assert response.json()["next_url"] is None
+    assert "<h1>" not in response.json()["html"]
+    assert response.json()["html"].count("<hr>") == 5
+
+    response = client.get(reverse("orders_shop"), {"status": Order.Status.DELIVERED})
+    assert [o.status for o in response.context["orders"]] == [Order.Status.DELIVERED] * 5
+
+
+def test_update_orders_checks_ownership_and_records_history(shop, category, buyer, address):
+    other_shop = Shop.objects.create(name="Other Shop")
+    mine = Product.objects.create(title="Мой", price=100, count=10, shop=shop, category=category)
+    foreign = Product.objects.create(title="Чужой", price=100, count=10, shop=other_shop, category=category)
+    Cart.objects.create(user=buyer, product=mine, count=1)
+    Cart.objects.create(user=buyer, product=foreign, count=1)
+    group = place_order(buyer, address, list(Cart.objects.filter(user=buyer).select_related("product__shop")))
+    my_line, foreign_line = group.lines.order_by("pk")
+
+    result = update_orders(
+        shop, [my_line.pk, foreign_line.pk], Order.Status.TRANSIT, {my_line.pk: "RA1", foreign_line.pk: "RA2"}
+    )
+    assert result == (1, 1)
+    assert list(Order.objects.order_by("pk").values_list("status", "track")) == [
+        (Order.Status.TRANSIT, "RA1"), (Order.Status.CREATED, ""),
+    ]
+    assert list(OrderStatusHistory.objects.values_list("order_id", "status")) == [(my_line.pk, Order.Status.TRANSIT)]
+
+    assert update_orders(shop, [my_line.pk], Order.Status.TRANSIT) == (0, 0)
+    assert OrderStatusHistory.objects.count() == 1
+
+
+def test_export_orders_streams_filtered_rows(client, shop, category, buyer, address):
+    product = Product.objects.create(title="Товар", price=100, count=10, shop=shop, category=category)
+    for _ in range(3):
+        Cart.objects.create(user=buyer, product=product, count=1)
+        place_order(buyer, address, list(Cart.objects.filter(user=buyer).select_related("product__shop")))
+    first = Order.objects.order_by("pk").first()
+    Order.objects.filter(pk=first.pk).update(status=Order.Status.DELIVERED)
+    Order.objects.exclude(pk=first.pk).update(time_created=timezone.now() - timedelta(days=10))
+    shop.user = User.objects.create_user(username="shopuser", password="testpass", is_shop=True)
+    shop.save()
+    client.force_login(shop.user)
+
+    response = client.get(reverse("export_orders"))
+    assert response.streaming
+    rows = b"".join(response.streaming_content).decode("utf-8-sig").splitlines()
+    assert rows[0].startswith("line_id,order_id,time_created")
+    assert len(rows) == 4
+
+    response = client.get(reverse("export_orders"), {"format": "jsonl", "status": Order.Status.DELIVERED})
+    lines = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+    assert [(line["line_id"], line["status"], line["city"]) for line in lines] == [(first.pk, "Доставлен", "Moscow")]
+
+    today = timezone.localdate().isoformat()
+    response = client.get(reverse("export_orders"), {"date_from": today, "date_to": today})
+    assert len(b"".join(response.streaming_content).decode("utf-8-sig").splitlines()) == 2
+
+
+def test_shop_daily_sales_match_rebuild(client, shop, category, buyer, address, django_assert_max_num_queries):
+    first = Product.objects.create(title="Первый", price=100, count=10, shop=shop, category=category)
+    second = Product.objects.create(title="Второй", price=30, count=10, shop=shop, category=category)
+    for counts in [(2, 1), (1, 0), (3, 4)]:
+        for product, count in zip([first, second], counts):
+            if count:
+                Cart.objects.create(user=buyer, product=product, count=count)
+        place_order(buyer, address, list(Cart.objects.filter(user=buyer).select_related("product__shop")))
+    lines = list(Order.objects.order_by("pk").values_list("pk", flat=True))
+    update_orders(shop, lines[:3], Order.Status.DELIVERED)
+    update_orders(shop, lines[:1], Order.Status.TRANSIT)
+
+    def snapshot():
+        return sorted(ShopDailySales.objects.values_list(
+            "product_id", "day", "revenue", "units", "orders", "delivered_revenue", "delivered_units"
+        ))
+
+    incremental = snapshot()
+    assert incremental == [
+        (first.pk, timezone.localdate(), 600, 6, 3, 100, 1),
+        (second.pk, timezone.localdate(), 150, 5, 2, 30, 1),
+    ]
+    assert rebuild_sales() == 2
+    assert snapshot() == incremental
+
+    shop.user = User.objects.create_user(username="shopuser", password="testpass", is_shop=True)
+    shop.save()
+    client.force_login(shop.user)
+    with django_assert_max_num_queries(7):
+        response = client.get(reverse("shop_analytics"))
+    assert response.context["totals"]["revenue"] == 750
+    assert [p["product__title"] for p in response.context["products"]] == ["Первый", "Второй"]
+
+
+def test_mine_rules_from_checkouts(shop, category, buyer, address):
+    bread, milk, tea = [
+        Product.objects.create(title=title, price=10, count=100, shop=shop, category=category)
+        for title in ["Хлеб", "Молоко", "Чай"]
+    ]
+    for basket in [(bread, milk), (bread, milk), (bread, milk, tea), (tea,)]:
+        for product in basket:
+            Cart.objects.create(user=buyer, product=product, count=1)
+        place_order(buyer, address, list(Cart.objects.filter(user=buyer).select_related("product__shop")))
+
+    assert mine_rules(min_support=0.5, min_confidence=0.5) == (4, 4, 2)
+    rule = AssociationRule.objects.get(antecedent=str(bread.pk), consequent=milk)
+    assert (rule.count, rule.support, rule.confidence) == (3, 0.75, 1.0)
+    assert rule.lift == pytest.approx(4 / 3)
+
+
+def test_pair_rules_follow_checkouts_incrementally(shop, category, buyer, address):
+    bread, milk, tea = [
+        Product.objects.create(title=title, price=10, count=100, shop=shop, category=category)
+        for title in ["Хлеб", "Молоко", "Чай"]
+    ]
+
+    def checkout(*basket):
+        for product in basket:
+            Cart.objects.create(user=buyer, product=product, count=1)
+        place_order(buyer, address, list(Cart.objects.filter(user=buyer).select_related("product__shop")))
+
+    def rules():
+        return sorted(AssociationRule.objects.values_list("antecedent", "consequent_id", "count", "confidence"))
+
+    for basket in [(bread, milk), (bread, milk), (bread, tea)]:
+        checkout(*basket)
+    assert PairCount.objects.get(item_a=bread, item_b=milk).count == 2
+    assert refresh_pair_rules(min_support=0.5, min_confidence=0.5) == 2
+    assert rules() == [(str(bread.pk), milk.pk, 2, 2 / 3), (str(milk.pk), bread.pk, 2, 1.0)]
+    assert not PairCount.objects.filter(dirty=True).exists()
+
+    checkout(milk, tea)
+    checkout(milk, tea)
+    refresh_pair_rules(min_support=0.4, min_confidence=0.5)
+    incremental = rules()
+    assert len(incremental) == 4
+    mine_rules(min_support=0.4, min_confidence=0.5, max_length=2)
+    assert rules() == incremental
+
+
+def test_also_bought_neighbors(shop, category, buyer, address, django_assert_num_queries):
+    bread, milk, tea, jam = [
+        Product.objects.create(title=title, price=10, count=100, shop=shop, category=category)
+        for title in ["Хлеб", "Молоко", "Чай", "Джем"]
+    ]
+    for basket in [(bread, milk), (bread, milk), (bread, milk, jam), (bread, jam), (bread, tea)]:
+        for product in basket:
+            Cart.objects.create(user=buyer, product=product, count=1)
+        place_order(buyer, address, list(Cart.objects.filter(user=buyer).select_related("product__shop")))
+
+    assert build_bought_neighbors(k=2) == 4
+    with django_assert_num_queries(1):
+        assert product_neighbors(bread.pk) == [milk, jam]
+    Product.objects.filter(pk=milk.pk).update(count=0)
+    Product.objects.filter(pk=jam.pk).update(price=25)
+    with django_assert_num_queries(1):
+        neighbors = product_neighbors(bread.pk)
+    assert [(p.pk, p.price) for p in neighbors] == [(jam.pk, 25)]
+    assert product_neighbors(tea.pk) == []
+    neighbors_cache.clear()
+
+
+def test_favorite_neighbors_use_chunked_cosine(shop, category):
+    pytest.importorskip("scipy")
+    products = [
+        Product.objects.create(title=f"Товар {i}", price=10, count=1, shop=shop, category=category)
+        for i in range(4)
+    ]
+    buyers = [
+        Buyer.objects.create(user=User.objects.create_user(username=f"fan{i}", password="testpass"))
+        for i in range(3)
+    ]
+    for buyer, favorites in zip(buyers, [(0, 1), (0, 1, 2), (2, 3)]):
+        for i in favorites:
+            Favorite.objects.create(user=buyer, product=products[i])
+    Cart.objects.create(user=buyers[0], product=products[3])
+
+    ids = [p.pk for p in products]
+    for chunk_size in (1, 3, 10):
+        neighbors = favorite_neighbors(k=2, chunk_size=chunk_size)
+        assert [n for _, n in neighbors[ids[0]]] == [ids[1], ids[2]]
+        assert neighbors[ids[0]][0][0] == pytest.approx(1.0)
+        assert neighbors[ids[3]] == [(pytest.approx(1 / 2 ** 0.5), ids[2])]
+
+    neighbors = favorite_neighbors(with_cart=True, k=3)
+    assert ids[3] in [n for _, n in neighbors[ids[0]]]
+
+
+def test_personal_feed_ranks_neighbors_and_expires_on_activity(shop, category, buyer, address, django_assert_max_num_queries):
+    bread, milk, tea, jam, salt = [
+        Product.objects.create(title=title, price=10, count=100, shop=shop, category=category)
+        for title in ["Хлеб", "Молоко", "Чай", "Джем", "Соль"]
+    ]
+    ProductNeighbor.objects.bulk_create([
+        ProductNeighbor(product=bread, neighbor=milk, rank=0, score=0.9),
+        ProductNeighbor(product=bread, neighbor=jam, rank=1, score=0.3),
+        ProductNeighbor(product=tea, neighbor=jam, kind=ProductNeighbor.Kind.FAVORITE, rank=0, score=0.8),
+    ])
+    Favorite.objects.create(user=buyer, product=bread)
+    assert rank_products(buyer) == [milk.pk, jam.pk]
+
+    Favorite.objects.create(user=buyer, product=tea)
+    assert rank_products(buyer) == [jam.pk, milk.pk]
+
+    User.objects.filter(pk=buyer.user_id).update(is_buyer=True)
+    buyer.user.refresh_from_db()
+    assert personal_feed(buyer.user) == [jam, milk]
+    with django_assert_max_num_queries(1):
+        assert personal_feed(buyer.user) == [jam, milk]
+
+    add_to_cart(buyer, jam.pk)
+    assert personal_feed(buyer.user) == [milk]
+
+
+def test_order_lines_of_one_checkout_page_without_gaps(shop, category, buyer, address):
+    for i in range(6):
+        product = Product.objects.create(title=f"Товар {i}", price=100, count=10, shop=shop, category=category)
+        Cart.objects.create(user=buyer, product=product, count=1)
+    group = place_order(buyer, address, list(Cart.objects.filter(user=buyer).select_related("product__shop")))
+    group.lines.update(time_created=timezone.now().replace(microsecond=123456))
+
+    seen, cursor = [], None
+    while True:
+        page = keyset_page(shop_order_lines(shop), cursor, ORDERS_ORDERING, per_page=2)
+        seen += [line.pk for line in page]
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+    assert seen == sorted(group.lines.values_list("pk", flat=True), reverse=True)
+
+
+def test_overlapping_holds_do_not_share_last_unit(shop, category, buyer, monkeypatch):
+    product = Product.objects.create(title="Последний", price=100, count=1, shop=shop, category=category)
+    other = Buyer.objects.create(user=User.objects.create_user(username="other", password="testpass"))
+    Cart.objects.create(user=buyer, product=product, count=1)
+    Cart.objects.create(user=other, product=product, count=1)
+    release_holds = reservations.release_holds
+    other_holds = []
+
+    def release_after_other(user):
+        # второй покупатель успевает занять блокировку и закоммитить резерв раньше
+        if user == buyer and not other_holds:
+            other_holds.append(hold_cart(other, list(Cart.objects.filter(user=other))))
+        release_holds(user)
+
+    monkeypatch.setattr(reservations, "release_holds", release_after_other)
+    assert hold_cart(buyer, list(Cart.objects.filter(user=buyer))) == {product.pk: 0}
+    assert other_holds == [{product.pk: 1}]
+    assert list(StockHold.objects.values_list("user_id", "count")) == [(other.pk, 1)]
+
+
+def test_product_save_keeps_concurrent_ratings(shop, category, buyer):
+    product = Product.objects.create(title="Товар", price=100, shop=shop, category=category)
+    loaded = Product.objects.get(pk=product.pk)
+    Review.objects.create(product=product, user=buyer, score=4)
+
+    loaded.title = "Новое название"
+    loaded.save()
+    product.refresh_from_db()
+    assert (product.title, product.rating_count, product.rating_avg, product.rating_4) == ("Новое название", 1, 4.0, 1)
+
+
+def test_export_orders_escapes_formulas_and_ignores_impossible_dates(client, shop, category, buyer, address):
+    product = Product.objects.create(title="Товар", price=100, count=10, shop=shop, category=category)
+    Cart.objects.create(user=buyer, product=product, count=1)
+    place_order(buyer, address, list(Cart.objects.filter(user=buyer).select_related("product__shop")))
+    Order.objects.update(track='=HYPERLINK("http://example.com")')
+    shop.user = User.objects.create_user(username="shopuser", password="testpass", is_shop=True)
+    shop.save()
+    client.force_login(shop.user)
+
+    response = client.get(reverse("export_orders"), {"date_from": "2026-02-30"})
+    assert response.status_code == 200
+    rows = b"".join(response.streaming_content).decode("utf-8-sig").splitlines()
+    assert len(rows) == 2
+    assert ",\"'=HYPERLINK(\"\"http://example.com\"\")\"," in rows[1]
+
+
+def test_shop_analytics_falls_back_on_invalid_dates(client, shop):
+    shop.user = User.objects.create_user(username="shopuser", password="testpass", is_shop=True)
+    shop.save()
+    client.force_login(shop.user)
+
+    response = client.get(reverse("shop_analytics"), {"date_from": "2026-02-30", "date_to": "вчера"})
+    assert response.status_code == 200
+    assert response.context["date_to"] == timezone.localdate()
+    assert response.context["date_from"] == timezone.localdate() - timedelta(days=30)
+
+
+def test_pair_counters_skip_large_baskets_and_empty_orders(shop, category, buyer, address):
+    products = [
+        Product.objects.create(title=f"Товар {i}", price=10, count=100, shop=shop, category=category)
+        for i in range(MAX_PAIR_BASKET + 1)
+    ]
+
+    def checkout(*basket):
+        for product in basket:
+            Cart.objects.create(user=buyer, product=product, count=1)
+        return place_order(buyer, address, list(Cart.objects.filter(user=buyer).select_related("product__shop")))
+
+    checkout(*products)
+    assert ItemCount.objects.count() == len(products)
+    assert not PairCount.objects.exists()
+
+    first, second = products[:2]
+    checkout(first, second)
+    checkout(first, second)
+    Order.objects.filter(group=checkout(first)).delete()
+    refresh_pair_rules(min_support=0.5, min_confidence=0.5)
+    assert AssociationRule.objects.get(antecedent=str(first.pk), consequent=second).support == 2 / 3
+
+
+def test_cart_add_ajax_updates_cached_summary(client, shop, category, buyer, django_assert_num_queries):
+    product = Product.objects.create(title="Товар", price=100, count=3, shop=shop, category=category)
+    client.force_login(buyer.user)
+    assert client.post(reverse("cart_add_ajax"), {"product_id": "abc"}).status_code == 400
+    assert client.post(reverse("cart_add_ajax")).status_code == 400
+    assert client.post(reverse("cart_decr_in_index_ajax"), {"product_id": "abc"}).status_code == 400
+
+    assert cart_summary(buyer.user_id) == {"count": 0, "sum": 0}
+    client.post(reverse("cart_add_ajax"), {"product_id": product.pk})
+    # сессия, пользователь, покупатель и upsert; сводка берётся из кэша
+    with django_assert_num_queries(4):
+        response = client.post(reverse("cart_add_ajax"), {"product_id": product.pk})
+    assert response.json()["cart"] == {"count": 2, "sum": 200}
+    assert not response.json()["last"]
+
+    Product.objects.filter(pk=product.pk).update(price=50)
+    # упёрлись в остаток: прибавка неизвестна, сводка пересчитывается агрегатом
+    response = client.post(reverse("cart_add_ajax"), {"product_id": product.pk})
+    assert response.json()["last"] and response.json()["cart"] == {"count": 3, "sum": 150}
+
+
+def test_fpgrowth_parallel_matches_serial_and_brute_force():
+    rng = random.Random(42)
+    transactions = [set(rng.sample(range(15), rng.randint(1, 6))) for _ in range(400)]
+    min_count = 8
+
+    serial = fpgrowth.frequent_itemsets(transactions, min_count, max_length=3)
+    parallel = fpgrowth.frequent_itemsets(transactions, min_count, max_length=3, workers=3)
+    assert parallel == serial
+
+    brute = Counter(
+        itemset for items in transactions for size in (1, 2, 3) for itemset in combinations(sorted(items), size)
+    )
+    assert serial == {itemset: count for itemset, count in brute.items() if count >= min_count}
+    assert any(len(itemset) == 3 for itemset in serial)
+
+    rules = sorted(fpgrowth.association_rules(serial, len(transactions), 0.1))
+    assert rules and sorted(fpgrowth.association_rules(parallel, len(transactions), 0.1)) == rules
+
+
+def test_product_listing_has_no_review_or_cart_fan_out(shop, category, django_assert_num_queries):
+    product = Product.objects.create(title="Товар", price=100, count=10, shop=shop, category=category)
+    other = Product.objects.create(title="Другой", price=200, count=10, shop=shop, category=category)
+    for i in range(3):
+        buyer = Buyer.objects.create(user=User.objects.create_user(username=f"buyer{i}", password="testpass"))
+        Review.objects.create(product=product, user=buyer, score=i + 3)
+        Cart.objects.create(user=buyer, product=product, count=i + 1)
+
+    listing = product_listing(min_price=50, max_price=150)
+    assert "GROUP BY" not in str(listing.query)
+    with django_assert_num_queries(1):
+        products = list(listing)
+    assert products == [product]
+    assert (products[0].rating_count, products[0].rating_avg, products[0].shop.name) == (3, 4.0, "Test Shop")
+    assert list(product_listing()) == [product, other]
+
+
+def test_category_tree_cache_follows_category_changes(db, django_assert_num_queries):
+    root = ProdCategory.objects.create(name="Электроника", slug="electronics")
+    assert "Электроника" in category_tree_html()
+    with django_assert_num_queries(0):
+        category_tree_html()
+
+    phones = ProdCategory.objects.create(name="Телефоны", slug="phones", parent=root)
+    assert "Телефоны" in category_tree_html()
+    phones.name = "Смартфоны"
+    phones.save()
+    assert "Смартфоны" in category_tree_html()
+
+    phones.delete()
+    html = category_tree_html()
+    assert "Смартфоны" not in html and "Электроника" in html
+
+
+def test_category_page_queries_do_not_grow_with_depth(client, shop, category, django_assert_num_queries):
+    parent, levels = None, []
+    for depth in range(4):
+        parent = ProdCategory.objects.create(name=f"Уровень {depth}", slug=f"level-{depth}", parent=parent)
+        levels.append(parent)
+        Product.objects.create(
+            title=f"Товар {depth}", price=100, count=1, shop=shop, category=category, prodcategory=parent
+        )
+    # ветка рядом с деревом не должна попадать в выборку
+    other = ProdCategory.objects.create(name="Другое", slug="other")
+    Product.objects.create(title="Чужой", price=100, count=1, shop=shop, category=category, prodcategory=other)
+    client.get(reverse("category", kwargs={"category_slug": "level-0"}))
+
+    for depth, level in enumerate(levels):
+        # категория, крошки, подкатегории, товары
+        with django_assert_num_queries(4):
+            response = client.get(reverse("category", kwargs={"category_slug": level.slug}))
+        assert [c.slug for c in response.context["path"]] == [c.slug for c in levels[: depth + 1]]
+        assert [p.title for p in response.context["prod"]] == [f"Товар {d}" for d in range(depth, 4)]
+
+
+def test_reconcile_carts_fixes_only_stale_lines(shop, category, buyer, django_assert_num_queries):
+    plenty, sold_out, scarce = [
+        Product.objects.create(title=title, price=10, count=5, shop=shop, category=category)
+        for title in ["Много", "Закончился", "Мало"]
+    ]
+    for product in [plenty, sold_out, scarce]:
+        Cart.objects.create(user=buyer, product=product, count=3)
+    carts = Cart.objects.filter(user=buyer)
+
+    with django_assert_num_queries(1):
+        assert reconcile_carts(carts) == (0, 0)
+
+    Product.objects.filter(pk=sold_out.pk).update(count=0)
+    Product.objects.filter(pk=scarce.pk).update(count=2)
+    assert reconcile_carts(carts) == (1, 1)
+    assert sorted(carts.values_list("product__title", "count")) == [("Мало", 2), ("Много", 3)]
+
+
+def test_cart_batch_coalesces_ops_and_rejects_malformed(client, shop, category, buyer):
+    tea, jam = [
+        Product.objects.create(title=title, price=10, count=3, shop=shop, category=category)
+        for title in ["Чай", "Джем"]
+    ]
+    Cart.objects.create(user=buyer, product=jam, count=1)
+    User.objects.filter(pk=buyer.user_id).update(is_buyer=True)
+    client.force_login(buyer.user)
+
+    ops = [
+        {"product_id": tea.pk, "delta": 1}, {"product_id": tea.pk, "delta": 5},
+        {"product_id": tea.pk, "delta": -1}, {"product_id": str(jam.pk), "delta": -1},
+    ]
+    data = {"ops": json.dumps(ops)}
+    response = client.post(reverse("cart_batch"), data, HTTP_IDEMPOTENCY_KEY="batch-1")
+    assert response.json()["items"] == {
+        str(tea.pk): {"count": 3, "last": True}, str(jam.pk): {"count": 0, "last": False},
+    }
+    assert response.json()["cart"] == {"count": 3, "sum": 30}
+    assert list(Cart.objects.filter(user=buyer).values_list("product_id", "count")) == [(tea.pk, 3)]
+
+    replay = client.post(reverse("cart_batch"), data, HTTP_IDEMPOTENCY_KEY="batch-1")
+    assert replay["Idempotent-Replay"] == "true" and replay.json() == response.json()
+    assert Cart.objects.get(user=buyer, product=tea).count == 3
+
+    bad_ops = [
+        "не json", json.dumps({"product_id": tea.pk, "delta": 1}),
+        json.dumps([{"product_id": "x", "delta": 1}]), json.dumps([{"product_id": tea.pk}]),
+        json.dumps([{"product_id": tea.pk, "delta": 10**20}]), json.dumps([{"product_id": 10**20, "delta": 1}]),
+        json.dumps([{"product_id": tea.pk, "delta": 600}] * 2), json.dumps([{"product_id": tea.pk, "delta": 0}] * 101),
+    ]
+    for bad in bad_ops:
+        assert client.post(reverse("cart_batch"), {"ops": bad}).status_code == 400
+    assert Cart.objects.get(user=buyer, product=tea).count == 3
+
+
+def test_search_ranks_thousands_of_matches_in_one_join(shop, category):
+    Product.objects.bulk_create([
+        Product(title=f"Телефон {i}", description="телефон " * (i % 5), price=100, shop=shop, category=category)
+        for i in range(3000)
+    ])
+    rebuild_index()
+
+    started = time.monotonic()
+    seen, cursor = [], None
+    while True:
+        page = keyset_page(search_products(Product.objects.all(), "телефон"), cursor, per_page=500)
+        seen += [(p.search_rank, p.pk) for p in page]
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+    assert time.monotonic() - started < 2
+    assert len(seen) == 3000 and seen == sorted(seen)
+    assert str(search_products(Product.objects.all(), "телефон").query).count("MATCH") == 1
+
+
+def test_tampered_cursor_opens_first_page(client, shop, category, buyer, address):
+    product = Product.objects.create(title="Товар", price=100, count=10, shop=shop, category=category)
+    Cart.objects.create(user=buyer, product=product, count=1)
+    place_order(buyer, address, list(Cart.objects.filter(user=buyer).select_related("product__shop")))
+    User.objects.filter(pk=buyer.user_id).update(is_buyer=True)
+    client.force_login(buyer.user)
+
+    bad_cursors = [encode_cursor(["abc"]), encode_cursor([{"id": 1}]), encode_cursor(["вчера", "abc"]), "!!"]
+    for cursor in bad_cursors:
+        response = client.get(reverse("home"), {"cursor": cursor})
+        assert [p.pk for p in response.context["prod"]] == [product.pk]
+        response = client.get(reverse("search"), {"q": "товар", "cursor": cursor})
+        assert [p.pk for p in response.context["prod"]] == [product.pk]
+        response = client.get(reverse("orders"), {"cursor": cursor})
+        assert len(response.context["groups"]) == 1
+
+
+def test_idempotency_key_checks_payload_and_frees_abandoned_keys(client, shop, category, buyer, rf):
+    tea, jam = [
+        Product.objects.create(title=title, price=10, count=10, shop=shop, category=category)
+        for title in ["Чай", "Джем"]
+    ]
+    User.objects.filter(pk=buyer.user_id).update(is_buyer=True)
+    client.force_login(buyer.user)
+
+    def batch(product, key):
+        data = {"ops": json.dumps([{"product_id": product.pk, "delta": 1}])}
+        return client.post(reverse("cart_batch"), data, HTTP_IDEMPOTENCY_KEY=key)
+
+    assert batch(tea, "k1").status_code == 200
+    assert batch(jam, "k1").status_code == 422
+    assert not Cart.objects.filter(user=buyer, product=jam).exists()
+    assert IdempotencyKey.objects.get().expires_at > timezone.now() + timedelta(hours=23)
+
+    # процесс упал, не сохранив ответ: ключ свободен после короткой аренды
+    request = rf.post(reverse("cart_batch"))
+    request.user = buyer.user
+    IdempotencyKey.objects.create(key=make_key(request, "k2"), expires_at=timezone.now() - timedelta(seconds=1))
+    response = batch(jam, "k2")
+    assert response.status_code == 200 and "Idempotent-Replay" not in response
+    assert Cart.objects.get(user=buyer, product=jam).count == 1
+
+
+def test_leaf_category_pages_in_index_order(shop, category):
+    root = ProdCategory.objects.create(name="Корень", slug="root")
+    leaf = ProdCategory.objects.create(name="Лист", slug="leaf", parent=root)
+    for price in [300, 100, 200, 100]:
+        Product.objects.create(title="Товар", price=price, count=1, shop=shop, category=category, prodcategory=leaf)
+
+    page = keyset_page(product_listing(category=leaf, min_price=0, max_price=10**9), per_page=3)
+    assert [p.price for p in page] == [100, 100, 200]
+    assert [p.price for p in keyset_page(product_listing(category=leaf), page.next_cursor)] == [300]
+
+    sql, params = product_listing(category=leaf, min_price=0, max_price=10**9)[:25].query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        plan = " ".join(row[-1] for row in cursor.fetchall())
+    assert "chipi_product_cat_price_idx" in plan and "TEMP B-TREE" not in plan
@@ -0,0 +1,143 @@
+from django.db import transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, PositiveIntegerField, Prefetch, Q, When
+
+from .analytics import record_sales, record_status_change
+from .cart import invalidate_cart_summary, reconcile_carts
+from .mining import record_basket
+from .models import Cart, Order, OrderGroup, OrderStatusHistory, Product
+from .reservations import held_by_others, release_holds
+
+
+class StockChanged(Exception):
+    """Остаток какого-то товара меньше, чем количество в корзине."""
+
+
+ADDRESS_FIELDS = [
+    "first_name", "middle_name", "last_name", "email", "phone",
+    "country", "region", "city", "index", "addr",
+]
+
+
+def place_order(buyer, address, carts, card_last4=""):
+    """Оформляет заказ по строкам корзины одной транзакцией.
+
+    Остатки списываются одним условным UPDATE (count >= количества в
+    корзине плюс чужие активные резервы для каждого товара). Адрес и оплата
+    пишутся один раз в OrderGroup, строки заказа создаются через bulk_create
+    и учитываются в сводке продаж и счётчиках пар товаров, корзина удаляется
+    одним DELETE. Если хотя бы одного товара не хватает, выбрасывается
+    StockChanged и ничего не меняется. Возвращает OrderGroup.
+    """
+    enough_stock = Q()
+    for cart in carts:
+        enough_stock |= Q(pk=cart.product_id, count__gte=F("held") + cart.count)
+    new_stock = Case(
+        *[When(pk=cart.product_id, then=F("count") - cart.count) for cart in carts],
+        default=F("count"),
+        output_field=PositiveIntegerField(),
+    )
+
+    with transaction.atomic():
+        updated = Product.objects.alias(held=held_by_others(buyer)).filter(enough_stock).update(count=new_stock)
+        if updated != len(carts):
+            raise StockChanged
+
+        group = OrderGroup.objects.create(
+            user=buyer,
+            total=sum(cart.product.price * cart.count for cart in carts),
+            card_last4=card_last4,
+            **{field: getattr(address, field) for field in ADDRESS_FIELDS},
+        )
+        lines = Order.objects.bulk_create([
+            Order(
+                group=group,
+                product=cart.product,
+                shop=cart.product.shop,
+                count=cart.count,
+                price=cart.product.price,
+                title=cart.product.title,
+            )
+            for cart in carts
+        ])
+        record_sales(lines)
+        record_basket([cart.product_id for cart in carts])
+        Cart.objects.filter(pk__in=[cart.pk for cart in carts]).delete()
+        release_holds(buyer)
+
+    invalidate_cart_summary(buyer.user_id)
+    reconcile_carts(Cart.objects.filter(product__in=[cart.product_id for cart in carts]))
+    return group
+
+
+def update_orders(shop, order_ids, status=None, tracks=None):
+    """Меняет статус строк заказов магазина и трек-номера одной транзакцией.
+
+    order_ids получают статус status, tracks - {order_id: трек-номер}.
+    На каждое различное значение выполняется один UPDATE с проверкой,
+    что строки принадлежат магазину; чужие и несуществующие id пропускаются.
+    Смены статуса записываются в OrderStatusHistory и в сводку продаж
+    ShopDailySales. Возвращает число строк с изменённым статусом и с
+    изменённым трек-номером.
+    """
+    by_track = {}
+    for order_id, track in (tracks or {}).items():
+        by_track.setdefault(track, []).append(order_id)
+
+    status_changed = []
+    track_updated = 0
+    with transaction.atomic():
+        if status is not None and order_ids:
+            owned = Order.objects.filter(shop=shop, pk__in=order_ids).exclude(status=status)
+            status_changed = list(
+                owned.select_for_update().only("shop_id", "product_id", "price", "count", "status", "time_created")
+            )
+            Order.objects.filter(shop=shop, pk__in=[line.pk for line in status_changed]).update(status=status)
+            OrderStatusHistory.objects.bulk_create([
+                OrderStatusHistory(order=line, status=status) for line in status_changed
+            ])
+            record_status_change(status_changed, status)
+
+        for track, ids in by_track.items():
+            track_updated += Order.objects.filter(shop=shop, pk__in=ids).exclude(track=track).update(track=track)
+
+    return len(status_changed), track_updated
+
+
+ORDERS_ORDERING = ["-time_created", "-id"]
+ORDERS_PER_PAGE = 20
+
+
+def parse_status(value):
+    """Статус из параметра запроса; None - все заказы."""
+    try:
+        status = int(value)
+    except (TypeError, ValueError):
+        return None
+    return status if status in Order.Status.values else None
+
+
+def status_tabs(lines, count=None):
+    """Вкладки фильтра по статусу. Количества считаются одним GROUP BY status."""
+    counts = dict(lines.order_by().values_list("status").annotate(count=count or Count("id")))
+    return [
+        {"status": status, "label": label, "count": counts.get(status, 0)}
+        for status, label in Order.Status.choices
+    ]
+
+
+def buyer_order_groups(buyer, status=None):
+    """Заказы покупателя, новые первыми, со строками одним дополнительным запросом."""
+    groups = OrderGroup.objects.filter(user=buyer)
+    if status is not None:
+        groups = groups.filter(Exists(Order.objects.filter(group=OuterRef("pk"), status=status)))
+    return groups.order_by(*ORDERS_ORDERING).prefetch_related(
+        Prefetch("lines", queryset=Order.objects.order_by("pk"))
+    )
+
+
+def shop_order_lines(shop, status=None):
+    """Строки заказов магазина, новые первыми; адрес берётся из заказа тем же запросом."""
+    lines = Order.objects.filter(shop=shop)
+    if status is not None:
+        lines = lines.filter(status=status)
+    return lines.select_related("group").order_by(*ORDERS_ORDERING)
@@ -0,0 +1,94 @@
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+PAGE_SIZE = 24
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Даты пишутся с микросекундами: DjangoJSONEncoder обрезает их до
+    миллисекунд, и строки с одним временем создания пропадали бы между страницами."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values):
+    data = json.dumps(values, cls=CursorEncoder, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def get_ordering(queryset, ordering=None):
+    """Поля сортировки страницы; последним всегда идёт id, чтобы ключ был уникальным."""
+    ordering = list(ordering or queryset.query.order_by or queryset.model._meta.ordering or ["id"])
+    ordering = ["id" if f == "pk" else "-id" if f == "-pk" else f for f in ordering]
+    if ordering[-1].lstrip("-") != "id":
+        ordering.append("id")
+    return ordering
+
+
+def keyset_filter(ordering, values):
+    """(a, b) > (va, vb) в виде a > va OR (a = va AND b > vb) с учётом направления сортировки."""
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        condition |= equal & Q(**{f"{name}__{lookup}": value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def keyset_page(queryset, cursor=None, ordering=None, per_page=PAGE_SIZE):
+    """Страница выборки после курсора без OFFSET: WHERE по ключу сортировки и LIMIT."""
+    ordering = get_ordering(queryset, ordering)
+    queryset = queryset.order_by(*ordering)
+
+    values = decode_cursor(cursor)
+    # испорченный или устаревший курсор не роняет страницу, а открывает первую
+    if values and len(values) == len(ordering) and all(isinstance(v, (str, int, float)) for v in values):
+        try:
+            queryset = queryset.filter(keyset_filter(ordering, values))
+        except (ValueError, TypeError, ValidationError):
+            pass
+
+    items = list(queryset[: per_page + 1])
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, f.lstrip("-")) for f in ordering])
+    return KeysetPage(items, next_cursor)
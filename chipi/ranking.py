@@ -0,0 +1,107 @@
+"""Персональная подборка товаров для главной страницы.
+
+Кандидаты - соседи (ProductNeighbor) товаров, которые покупатель заказывал,
+добавил в избранное или в корзину, и самые популярные товары. Оценка
+кандидата - сумма весов сигналов, умноженных на близость, плюс
+популярность. Результат (id товаров) кешируется для пользователя и
+сбрасывается при изменении корзины, избранного или новом заказе.
+"""
+import math
+
+from django.core.cache import cache
+
+from .models import Cart, Favorite, ItemCount, Order, Product, ProductNeighbor
+
+try:
+    import numpy as np
+except ImportError:  # без numpy оценка считается обычным циклом
+    np = None
+
+FEED_KEY = "feed:{}"
+FEED_TIMEOUT = 30 * 60
+FEED_SIZE = 12
+
+POPULAR_KEY = "feed_popular"
+POPULAR_SIZE = 200
+POPULAR_TIMEOUT = 10 * 60
+
+ORDER_WEIGHT = 3.0
+FAVORITE_WEIGHT = 2.0
+CART_WEIGHT = 1.0
+POPULARITY_WEIGHT = 0.5
+# сколько последних товаров каждого сигнала учитывается
+SIGNAL_LIMIT = 50
+
+
+def invalidate_feed(*user_ids):
+    cache.delete_many([FEED_KEY.format(user_id) for user_id in user_ids])
+
+
+def user_signals(buyer):
+    """{product_id: вес} по заказам, избранному и корзине покупателя; берётся наибольший вес."""
+    signals = {}
+    sources = [
+        (Order.objects.filter(group__user=buyer, product__isnull=False).order_by("-time_created"), ORDER_WEIGHT),
+        (Favorite.objects.filter(user=buyer).order_by("-time_created"), FAVORITE_WEIGHT),
+        (Cart.objects.filter(user=buyer).order_by("-time_updated"), CART_WEIGHT),
+    ]
+    for queryset, weight in sources:
+        for product_id in queryset.values_list("product_id", flat=True)[:SIGNAL_LIMIT]:
+            signals[product_id] = max(signals.get(product_id, 0), weight)
+    return signals
+
+
+def popular_products():
+    """[(product_id, нормированная популярность 0..1)] - общий для всех список, кешируется."""
+    popular = cache.get(POPULAR_KEY)
+    if popular is None:
+        counts = list(ItemCount.objects.order_by("-count").values_list("product_id", "count")[:POPULAR_SIZE])
+        top = math.log1p(counts[0][1]) if counts else 1.0
+        popular = [(product_id, math.log1p(count) / top) for product_id, count in counts]
+        cache.set(POPULAR_KEY, popular, POPULAR_TIMEOUT)
+    return popular
+
+
+def score_candidates(signals, edges, popular, size):
+    """id size лучших кандидатов. edges - [(товар сигнала, сосед, близость)]."""
+    neighbors = [neighbor for _, neighbor, _ in edges] + [product_id for product_id, _ in popular]
+    if not neighbors:
+        return []
+    weights = [signals[product_id] * score for product_id, _, score in edges]
+    weights += [POPULARITY_WEIGHT * value for _, value in popular]
+
+    if np is None:
+        totals = {}
+        for product_id, weight in zip(neighbors, weights):
+            if product_id not in signals:
+                totals[product_id] = totals.get(product_id, 0) + weight
+        return sorted(totals, key=lambda product_id: (-totals[product_id], product_id))[:size]
+
+    ids, index = np.unique(np.array(neighbors, dtype=np.int64), return_inverse=True)
+    totals = np.bincount(index, weights=np.array(weights, dtype=np.float64), minlength=len(ids))
+    totals[np.isin(ids, np.fromiter(signals, dtype=np.int64, count=len(signals)))] = -np.inf
+    top = np.lexsort((ids, -totals))[:size]
+    return [int(ids[i]) for i in top if totals[i] > -np.inf]
+
+
+def rank_products(buyer, size=FEED_SIZE):
+    """id товаров подборки, лучшие первыми (без кеша)."""
+    signals = user_signals(buyer)
+    edges = list(
+        ProductNeighbor.objects.filter(product_id__in=list(signals)).values_list("product_id", "neighbor_id", "score")
+    ) if signals else []
+    # с запасом: часть товаров может закончиться или быть снята с публикации
+    return score_candidates(signals, edges, popular_products(), size * 2)
+
+
+def personal_feed(user, size=FEED_SIZE):
+    """Товары подборки для пользователя: id из кеша и один запрос за товарами в наличии."""
+    key = FEED_KEY.format(user.pk)
+    product_ids = cache.get(key)
+    if product_ids is None:
+        product_ids = rank_products(user.buyer, size)
+        cache.set(key, product_ids, FEED_TIMEOUT)
+    if not product_ids:
+        return []
+    products = Product.objects.filter(pk__in=product_ids, count__gt=0, is_published=True).in_bulk()
+    return [products[product_id] for product_id in product_ids if product_id in products][:size]
@@ -0,0 +1,59 @@
+from django.db.models import Count, F, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+SCORES = range(1, 6)
+
+
+def star_field(score):
+    return f"rating_{score}"
+
+
+def stars_sum():
+    """Сумма оценок товара, посчитанная по гистограмме."""
+    total = Value(0)
+    for score in SCORES:
+        total = total + score * F(star_field(score))
+    return total
+
+
+def average(total, count):
+    return Coalesce(Cast(total, FloatField()) / NullIf(count, 0), Value(0.0))
+
+
+def apply_review(product_id, score, delta):
+    """Учитывает добавленный (delta=1) или удалённый (delta=-1) отзыв одним UPDATE."""
+    from .models import Product
+
+    if score not in SCORES:
+        return recalculate_ratings(Product.objects.filter(pk=product_id))
+
+    new_count = F("rating_count") + delta
+    Product.objects.filter(pk=product_id).update(
+        rating_count=new_count,
+        rating_avg=average(stars_sum() + delta * score, new_count),
+        **{star_field(score): F(star_field(score)) + delta},
+    )
+
+
+def recalculate_ratings(products=None):
+    """Пересчитывает рейтинги по таблице отзывов. Возвращает число обновлённых товаров."""
+    if products is None:
+        from .models import Product
+
+        products = Product.objects.all()
+    reviews = products.model._meta.get_field("reviews").related_model
+
+    def count_reviews(**filters):
+        counts = (
+            reviews.objects.filter(product=OuterRef("pk"), **filters)
+            .values("product")
+            .annotate(total=Count("pk"))
+            .values("total")
+        )
+        return Coalesce(Subquery(counts), 0)
+
+    products.update(
+        rating_count=count_reviews(),
+        **{star_field(score): count_reviews(score=score) for score in SCORES},
+    )
+    return products.update(rating_avg=average(stars_sum(), F("rating_count")))
@@ -0,0 +1,112 @@
+import heapq
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.db import transaction
+
+from .models import ItemCount, PairCount, Product, ProductNeighbor
+
+NEIGHBORS_K = 10
+# пары, купленные вместе реже, не считаются похожими
+MIN_PAIR_COUNT = 2
+SAVE_BATCH_SIZE = 2000
+
+CACHE_SIZE = 10000
+CACHE_TTL = 10 * 60
+
+
+class LRUCache:
+    """Кеш в памяти процесса: не больше maxsize записей, каждая живёт ttl секунд."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None or item[0] < time.monotonic():
+                self.data.pop(key, None)
+                return default
+            self.data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+neighbors_cache = LRUCache(CACHE_SIZE, CACHE_TTL)
+
+
+def top_neighbors(scored_pairs, k=NEIGHBORS_K):
+    """{товар: [(score, сосед), ...]} - k лучших соседей по парам (a, b, score) в обе стороны."""
+    heaps = {}
+    for a, b, score in scored_pairs:
+        for product, neighbor in ((a, b), (b, a)):
+            heap = heaps.setdefault(product, [])
+            if len(heap) < k:
+                heapq.heappush(heap, (score, neighbor))
+            elif (score, neighbor) > heap[0]:
+                heapq.heapreplace(heap, (score, neighbor))
+    return {product: sorted(heap, reverse=True) for product, heap in heaps.items()}
+
+
+def save_neighbors(kind, neighbors):
+    """Заменяет соседей вида kind. Возвращает число записей."""
+    rows = (
+        ProductNeighbor(product_id=product, neighbor_id=neighbor, kind=kind, rank=rank, score=score)
+        for product, items in neighbors.items()
+        for rank, (score, neighbor) in enumerate(items)
+    )
+    with transaction.atomic():
+        ProductNeighbor.objects.filter(kind=kind).delete()
+        created = len(ProductNeighbor.objects.bulk_create(rows, batch_size=SAVE_BATCH_SIZE))
+    neighbors_cache.clear()
+    return created
+
+
+def build_bought_neighbors(k=NEIGHBORS_K, min_count=MIN_PAIR_COUNT):
+    """Соседи по совместным покупкам: косинус count(a, b) / sqrt(count(a) * count(b)) по счётчикам пар."""
+    item_counts = dict(ItemCount.objects.values_list("product_id", "count"))
+    pairs = PairCount.objects.filter(count__gte=min_count).values_list("item_a_id", "item_b_id", "count")
+    scored = (
+        (a, b, count / math.sqrt(item_counts[a] * item_counts[b]))
+        for a, b, count in pairs.iterator(chunk_size=SAVE_BATCH_SIZE)
+        if item_counts.get(a) and item_counts.get(b)
+    )
+    return save_neighbors(ProductNeighbor.Kind.BOUGHT, top_neighbors(scored, k))
+
+
+def product_neighbors(product_id, kind=ProductNeighbor.Kind.BOUGHT):
+    """Соседние товары для страницы товара, всегда одним запросом.
+
+    В кеше процесса лежат только id соседей. При промахе соседи читаются
+    по индексу (product, kind, rank) вместе с товарами, при попадании товары
+    читаются по первичному ключу, чтобы цена и наличие были свежими.
+    """
+    key = (product_id, kind)
+    neighbor_ids = neighbors_cache.get(key)
+    if neighbor_ids is None:
+        neighbors = list(
+            ProductNeighbor.objects.filter(product_id=product_id, kind=kind)
+            .select_related("neighbor")
+            .order_by("rank")
+        )
+        neighbors_cache.set(key, [n.neighbor_id for n in neighbors])
+        return [n.neighbor for n in neighbors if n.neighbor.is_published and n.neighbor.count > 0]
+    if not neighbor_ids:
+        return []
+    products = Product.objects.filter(pk__in=neighbor_ids, is_published=True, count__gt=0).in_bulk()
+    return [products[pk] for pk in neighbor_ids if pk in products]
@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, StockHold
+
+HOLD_TTL = timedelta(minutes=15)
+
+
+def held_by_others(buyer):
+    """Выражение для Product: сколько единиц товара держат активные резервы других покупателей."""
+    holds = (
+        StockHold.objects.filter(product=OuterRef("pk"), expires_at__gt=timezone.now())
+        .exclude(user=buyer)
+        .values("product")
+        .annotate(total=Sum("count"))
+        .values("total")
+    )
+    return Coalesce(Subquery(holds), 0)
+
+
+def available_stock(product_ids, buyer=None):
+    """{product_id: остаток за вычетом чужих активных резервов}."""
+    products = Product.objects.filter(pk__in=product_ids).annotate(available=F("count") - held_by_others(buyer))
+    return {product_id: max(available, 0) for product_id, available in products.values_list("pk", "available")}
+
+
+def hold_cart(buyer, carts):
+    """Резервирует товары корзины на HOLD_TTL, заменяя прежние резервы покупателя.
+
+    Резервируется не больше доступного остатка. Остаток считается внутри
+    транзакции после блокировки: DELETE своих резервов и SELECT FOR UPDATE
+    строк товаров, иначе два покупателя могут одновременно занять последнюю
+    единицу. Возвращает {product_id: зарезервировано}.
+    """
+    product_ids = sorted({cart.product_id for cart in carts})
+    expires_at = timezone.now() + HOLD_TTL
+
+    with transaction.atomic():
+        release_holds(buyer)
+        list(Product.objects.select_for_update().filter(pk__in=product_ids).order_by("pk").values_list("pk"))
+        available = available_stock(product_ids, buyer)
+        holds = {cart.product_id: min(cart.count, available.get(cart.product_id, 0)) for cart in carts}
+        StockHold.objects.bulk_create([
+            StockHold(user=buyer, product_id=product_id, count=count, expires_at=expires_at)
+            for product_id, count in holds.items()
+            if count > 0
+        ])
+    return holds
+
+
+def release_holds(buyer):
+    StockHold.objects.filter(user=buyer).delete()
+
+
+def expire_holds():
+    """Удаляет истёкшие резервы. Возвращает их количество."""
+    deleted, _ = StockHold.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,133 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "chipi_product_fts"
+
+# Веса колонок для bm25: совпадение в названии важнее, чем в описании
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+# Окончания, которые отрезаются от слов запроса (упрощённый стеммер для русского)
+RU_ENDINGS = sorted(
+    [
+        "иями", "ями", "ами", "ией", "иях", "ях", "ах", "ов", "ев", "ей", "ий", "ый", "ой",
+        "ая", "яя", "ое", "ее", "ие", "ые", "ого", "его", "ому", "ему", "ими", "ыми",
+        "ую", "юю", "ом", "ем", "ам", "ям", "ию", "ия", "ье", "ья", "ью", "ти", "ть",
+        "ешь", "ет", "ут", "ют", "ат", "ят", "ил", "ыл", "ла", "ло", "ли",
+        "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+    ],
+    key=len,
+    reverse=True,
+)
+MIN_STEM_LENGTH = 3
+
+NORMALIZE_SQL = "replace(replace(%s, 'ё', 'е'), 'Ё', 'Е')"
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize(text):
+    return (text or "").replace("ё", "е").replace("Ё", "Е")
+
+
+def is_enabled():
+    return connection.vendor == "sqlite"
+
+
+def stem(word):
+    """Отрезает русское окончание, чтобы искать по основе слова."""
+    word = normalize(word.lower())
+    for ending in RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[: -len(ending)]
+    return word
+
+
+def build_match_query(text):
+    """Строка запроса FTS5: все слова обязательны, поиск по префиксу основы."""
+    words = WORD_RE.findall(text or "")
+    return " ".join('"%s"*' % stem(word) for word in words)
+
+
+def search_products(queryset, text):
+    """Фильтрует товары по полнотекстовому индексу и сортирует по релевантности."""
+    match = build_match_query(text)
+    if not match:
+        return queryset
+
+    if not is_enabled():
+        return queryset.filter(Q(title__icontains=text) | Q(description__icontains=text))
+
+    # таблица индекса присоединяется один раз, bm25 считается по той же строке,
+    # а не коррелированным подзапросом на каждый найденный товар
+    table = queryset.model._meta.db_table
+    return (
+        queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = {table}.id", f"{FTS_TABLE} MATCH %s"],
+            params=[match],
+        )
+        .annotate(search_rank=RawSQL(f"bm25({FTS_TABLE}, %s, %s)", [TITLE_WEIGHT, DESCRIPTION_WEIGHT]))
+        .order_by("search_rank", "id")
+    )
+
+
+def get_connection(schema_editor=None):
+    return schema_editor.connection if schema_editor else connection
+
+
+def create_index(schema_editor=None):
+    conn = get_connection(schema_editor)
+    if conn.vendor != "sqlite":
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(title, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+
+def drop_index(schema_editor=None):
+    conn = get_connection(schema_editor)
+    if conn.vendor != "sqlite":
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def index_product(product):
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)",
+            [product.pk, normalize(product.title), normalize(product.description)],
+        )
+
+
+def unindex_product(product_id):
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product_id])
+
+
+def rebuild_index(schema_editor=None):
+    """Полностью пересобирает индекс одним INSERT ... SELECT. Возвращает число товаров."""
+    conn = get_connection(schema_editor)
+    if conn.vendor != "sqlite":
+        return 0
+    create_index(schema_editor)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, description) "
+            f"SELECT id, {NORMALIZE_SQL % 'title'}, {NORMALIZE_SQL % 'description'} FROM chipi_product"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
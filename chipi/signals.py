@@ -0,0 +1,36 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from mptt.signals import node_moved
+
+from . import categories, ratings, search
+from .models import ProdCategory, Product, Review
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    search.unindex_product(instance.pk)
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    if created:
+        ratings.apply_review(instance.product_id, instance.score, 1)
+    else:
+        ratings.recalculate_ratings(Product.objects.filter(pk=instance.product_id))
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    ratings.apply_review(instance.product_id, instance.score, -1)
+
+
+@receiver(post_save, sender=ProdCategory)
+@receiver(post_delete, sender=ProdCategory)
+@receiver(node_moved, sender=ProdCategory)
+def category_tree_changed(sender, **kwargs):
+    categories.invalidate_tree()
@@ -0,0 +1,103 @@
+"""Похожие товары по избранному (и корзинам): косинусная близость столбцов
+разреженной матрицы покупатель x товар.
+
+Матрица произведений товар x товар считается по кускам строк, поэтому в
+памяти одновременно только один кусок, а плотная матрица не строится.
+Нужны numpy и scipy; они импортируются только при пересчёте.
+"""
+from .models import Cart, Favorite, ProductNeighbor
+from .recommendations import NEIGHBORS_K, save_neighbors
+
+CHUNK_SIZE = 1000
+# вклад товара в корзине по сравнению с избранным
+CART_WEIGHT = 0.5
+# покупатели с огромным избранным почти ничего не говорят о сходстве и раздувают произведение
+MAX_USER_ITEMS = 1000
+MIN_SCORE = 0.0
+
+
+def load_matrix(with_cart=False):
+    """Разреженная матрица покупатель x товар (CSC) и массив id товаров по столбцам."""
+    import numpy as np
+    from scipy import sparse
+
+    pairs = [Favorite.objects.order_by().values_list("user_id", "product_id")]
+    weights = [1.0]
+    if with_cart:
+        pairs.append(Cart.objects.order_by().values_list("user_id", "product_id"))
+        weights.append(CART_WEIGHT)
+
+    users, products, values = [], [], []
+    for queryset, weight in zip(pairs, weights):
+        rows = np.fromiter(
+            (value for row in queryset.iterator(chunk_size=10000) for value in row), dtype=np.int64
+        ).reshape(-1, 2)
+        users.append(rows[:, 0])
+        products.append(rows[:, 1])
+        values.append(np.full(len(rows), weight))
+
+    user_ids, user_index = np.unique(np.concatenate(users), return_inverse=True)
+    product_ids, product_index = np.unique(np.concatenate(products), return_inverse=True)
+    matrix = sparse.coo_matrix(
+        (np.concatenate(values), (user_index, product_index)), shape=(len(user_ids), len(product_ids))
+    ).tocsr()
+    # товар и в избранном, и в корзине считается один раз с большим весом
+    matrix.sum_duplicates()
+    matrix.data = np.minimum(matrix.data, 1.0)
+
+    items_per_user = np.diff(matrix.indptr)
+    matrix = sparse.diags((items_per_user <= MAX_USER_ITEMS).astype(np.float64)) @ matrix
+    matrix.eliminate_zeros()
+    return matrix.tocsc(), product_ids
+
+
+def normalize_columns(matrix):
+    import numpy as np
+    from scipy import sparse
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    return (matrix @ sparse.diags(1.0 / norms)).tocsc()
+
+
+def chunk_neighbors(similarity, offset, product_ids, k, min_score):
+    """top-k по строкам куска similarity (CSR); строка i - товар offset + i."""
+    import numpy as np
+
+    neighbors = {}
+    for i in range(similarity.shape[0]):
+        start, end = similarity.indptr[i], similarity.indptr[i + 1]
+        columns = similarity.indices[start:end]
+        scores = similarity.data[start:end]
+        keep = (columns != offset + i) & (scores > min_score)
+        columns, scores = columns[keep], scores[keep]
+        if not len(scores):
+            continue
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+            columns, scores = columns[top], scores[top]
+        order = np.lexsort((-product_ids[columns], -scores))
+        neighbors[int(product_ids[offset + i])] = [
+            (float(scores[j]), int(product_ids[columns[j]])) for j in order
+        ]
+    return neighbors
+
+
+def favorite_neighbors(with_cart=False, k=NEIGHBORS_K, chunk_size=CHUNK_SIZE, min_score=MIN_SCORE):
+    """{товар: [(близость, сосед), ...]} - k ближайших по избранному."""
+    matrix, product_ids = load_matrix(with_cart)
+    normalized = normalize_columns(matrix)
+    transposed = normalized.T.tocsr()
+
+    neighbors = {}
+    for offset in range(0, len(product_ids), chunk_size):
+        similarity = (transposed[offset: offset + chunk_size] @ normalized).tocsr()
+        neighbors.update(chunk_neighbors(similarity, offset, product_ids, k, min_score))
+    return neighbors
+
+
+def build_favorite_neighbors(with_cart=False, k=NEIGHBORS_K, chunk_size=CHUNK_SIZE):
+    """Пересчитывает соседей вида FAVORITE. Возвращает число записей."""
+    if not Favorite.objects.exists():
+        return save_neighbors(ProductNeighbor.Kind.FAVORITE, {})
+    return save_neighbors(ProductNeighbor.Kind.FAVORITE, favorite_neighbors(with_cart, k, chunk_size))
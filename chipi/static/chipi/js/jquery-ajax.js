@@ -1,169 +1,162 @@
 // когда html document готов (прорисован)
 $(document).ready(function (){
-	// ловим событие клика по кнопке добавить в корзину
-	$(document).on("click", ".add-to-cart", function (e) {
-		// блокируем его базовое действие
-		e.preventDefault();
-
-		// берем количесвто товаров из корзины
-		var PrInCartCount = $("#prod-cart-count");
-		var CartCount = parseInt(PrInCartCount.text() || 0);
-		
-		// получвем id товара из атрибутта data-product-id
-		var product_id = $(this).data("product-id");
-
-		// из атребутта href берем ссылку на контроллер django 
-		var add_to_cart_url = $(this).attr("href");
-
-		$.ajax({
-			type: "POST",
-			url: add_to_cart_url,
-			data: {
-				product_id: product_id,
-				csrfmiddlewaretoken: $("[name=csrfmiddlewaretoken]").val(),
-			},
-
-			success: function (data) {
-				// successMessage.html(data.message);
-				// successMessage.fadeIn(400);
-				CartCount++;
-				PrInCartCount.text(CartCount);
-				// console.log("#nocart0-"+product_id);
-				$("#cart0-"+product_id).hide();
-				$("#cart1-"+product_id).show();
-				if (data['last'] == true) {
-					$("#prod_nolast-"+product_id).hide();
-					$("#prod_last-"+product_id).show();
-				} else {
-					// console.log(ProductCount)
-					$("#prod_nolast-"+product_id).show();
-					$("#prod_last-"+product_id).hide();
-				}
-
-				// var PrInCartCount = $("#prod-cart-count");
-
+	// изменения корзины копятся несколько сотен миллисекунд и отправляются одним запросом
+	var CART_BATCH_DELAY = 400;
+	var CartDeltas = {};
+	var CartTimer = null;
+
+	// ключ идемпотентности: повтор запроса с тем же ключом не изменит корзину второй раз
+	function newIdempotencyKey() {
+		if (window.crypto && crypto.randomUUID) {
+			return crypto.randomUUID();
+		}
+		return Date.now().toString(36) + Math.random().toString(36).slice(2);
+	}
 
+	function cartBatchData() {
+		var ops = [];
+		for (var product_id in CartDeltas) {
+			if (CartDeltas[product_id] != 0) {
+				ops.push({product_id: parseInt(product_id), delta: CartDeltas[product_id]});
 			}
-		})
+		}
+		CartDeltas = {};
+		clearTimeout(CartTimer);
+		CartTimer = null;
+		return ops;
 	}
-)
 
-	$(document).on("click", ".cart-decr", function (ev) {
-		// блокируем его базовое действие
-		ev.preventDefault();
-
-		// берем количесвто товаров из корзины
-		var PrInCartCount = $("#prod-cart-count");
-		var CartCount = parseInt(PrInCartCount.text() || 0);
-		
-		// получвем id товара из атрибутта data-product-id
-		var product_id = $(this).data("product-id");
-
-		// получаем количество товара текущее в корзине
-		var ProductCartCount = $("#prod-count-"+product_id);
-		var ProductCount = parseInt(ProductCartCount.text() || 0);
-		// console.log(ProductCount)
+	// показываем количество товара в карточке; last - в корзине весь остаток
+	function showProductCount(product_id, count, last) {
+		$("#prod-count-"+product_id).text(count);
+		if (count > 0) {
+			$("#cart0-"+product_id).hide();
+			$("#cart1-"+product_id).show();
+		} else {
+			$("#cart0-"+product_id).show();
+			$("#cart1-"+product_id).hide();
+		}
+		if (last === true) {
+			$("#prod_nolast-"+product_id).hide();
+			$("#prod_last-"+product_id).show();
+		} else if (last === false) {
+			$("#prod_nolast-"+product_id).show();
+			$("#prod_last-"+product_id).hide();
+		}
+	}
 
-		// из атребутта href берем ссылку на контроллер django 
-		var decr_cart_url = $(this).attr("href");
+	function flushCart() {
+		var ops = cartBatchData();
+		if (ops.length) {
+			sendCart(ops, newIdempotencyKey(), 1);
+		}
+	}
 
+	// при обрыве связи запрос повторяется с тем же ключом
+	function sendCart(ops, key, retries) {
 		$.ajax({
 			type: "POST",
-			url: decr_cart_url,
+			url: $("body").data("cart-batch-url"),
+			headers: {"Idempotency-Key": key},
 			data: {
-				product_id: product_id,
+				ops: JSON.stringify(ops),
 				csrfmiddlewaretoken: $("[name=csrfmiddlewaretoken]").val(),
 			},
 			success: function (data) {
-				// successMessage.html(data.message);
-				// successMessage.fadeIn(400);
-				CartCount--;
-				PrInCartCount.text(CartCount);
-				ProductCount--;
-				// console.log(ProductCount)
-				if (ProductCount > 0) {
-					ProductCartCount.text(ProductCount);
-					$("#prod_nolast-"+product_id).show();
-					$("#prod_last-"+product_id).hide();
-				} else {
-					// console.log(ProductCount)
-					$("#cart0-"+product_id).show();
-					$("#cart1-"+product_id).hide();
+				// ответ сервера - точные количества, пока не накопились новые клики
+				$("#prod-cart-count").text(data["cart"]["count"]);
+				for (var product_id in data["items"]) {
+					if (CartDeltas[product_id] === undefined) {
+						showProductCount(product_id, data["items"][product_id]["count"], data["items"][product_id]["last"]);
+					}
+				}
+			},
+			error: function (xhr) {
+				if ((xhr.status == 0 || xhr.status == 409) && retries > 0) {
+					setTimeout(function () { sendCart(ops, key, retries - 1); }, 1000);
 				}
-
-				// console.log("#nocart0-"+product_id);
-				// $("#nocart0-"+product_id).hide();
-				// $("#nocart1-"+product_id).show();
-
-				// var PrInCartCount = $("#prod-cart-count");
-			// console.log(data)
-
-
 			}
 		})
 	}
-)
 
+	function changeCart(product_id, delta) {
+		var count = parseInt($("#prod-count-"+product_id).text() || 0);
+		if (!$("#cart1-"+product_id).is(":visible")) {
+			count = 0;
+		}
+		count = Math.max(count + delta, 0);
+		showProductCount(product_id, count);
+
+		var CartCount = $("#prod-cart-count");
+		CartCount.text(Math.max(parseInt(CartCount.text() || 0) + delta, 0));
+
+		CartDeltas[product_id] = (CartDeltas[product_id] || 0) + delta;
+		clearTimeout(CartTimer);
+		CartTimer = setTimeout(flushCart, CART_BATCH_DELAY);
+	}
 
-	$(document).on("click", ".cart-inc", function (eve) {
+	// ловим событие клика по кнопкам добавить в корзину, "+" и "-"
+	$(document).on("click", ".add-to-cart, .cart-inc", function (e) {
 		// блокируем его базовое действие
-		eve.preventDefault();
-		
-		// берем количесвто товаров из корзины
-		var PrInCartCount = $("#prod-cart-count");
-		var CartCount = parseInt(PrInCartCount.text() || 0);
-		
-		// получвем id товара из атрибутта data-product-id
-		var product_id = $(this).data("product-id");
-
-		// получаем количество товара текущего в корзине
-		var ProductCartCount = $("#prod-count-"+product_id);
-		var ProductCount = parseInt(ProductCartCount.text() || 0);
-		// console.log(product_id)
-		// console.log(ProductCount)
-
-		// из атребутта href берем ссылку на контроллер django 
-		var decr_cart_url = $(this).attr("href");
+		e.preventDefault();
+		changeCart($(this).data("product-id"), 1);
+	})
+
+	$(document).on("click", ".cart-decr", function (e) {
+		e.preventDefault();
+		changeCart($(this).data("product-id"), -1);
+	})
+
+	// при уходе со страницы отправляем то, что не успели
+	$(window).on("pagehide", function () {
+		var ops = cartBatchData();
+		if (ops.length && navigator.sendBeacon) {
+			var form = new FormData();
+			form.append("ops", JSON.stringify(ops));
+			form.append("idempotency_key", newIdempotencyKey());
+			form.append("csrfmiddlewaretoken", $("[name=csrfmiddlewaretoken]").val());
+			navigator.sendBeacon($("body").data("cart-batch-url"), form);
+		}
+	})
+
+	// подгрузка следующей страницы товаров (кнопка "Показать ещё" и бесконечная прокрутка)
+	var PageLoading = false;
+
+	function loadNextPage(LoadMore) {
+		if (PageLoading || !LoadMore.length) {
+			return;
+		}
+		PageLoading = true;
 
 		$.ajax({
-			type: "POST",
-			url: decr_cart_url,
-			data: {
-				product_id: product_id,
-				csrfmiddlewaretoken: $("[name=csrfmiddlewaretoken]").val(),
-			},
+			type: "GET",
+			url: LoadMore.attr("href"),
+			dataType: "json",
 			success: function (data) {
-				// successMessage.html(data.message);
-				// successMessage.fadeIn(400);
-				// console.log(data['max']);
-				if (data['max'] == false) {
-					CartCount++;
-					PrInCartCount.text(CartCount);
-					ProductCount++;
-					ProductCartCount.text(ProductCount);
-				} 
-
-
-				if (data['last'] == true) {
-					$("#prod_nolast-"+product_id).hide();
-					$("#prod_last-"+product_id).show();
+				$(".product-list").append(data["html"]);
+				if (data["next_url"]) {
+					LoadMore.attr("href", data["next_url"]);
 				} else {
-					// console.log(ProductCount)
-					$("#prod_nolast-"+product_id).show();
-					$("#prod_last-"+product_id).hide();
+					LoadMore.remove();
 				}
-				// console.log("#nocart0-"+product_id);
-				// $("#nocart0-"+product_id).hide();
-				// $("#nocart1-"+product_id).show();
-
-				// var PrInCartCount = $("#prod-cart-count");
-			// console.log(data)
-
-
+			},
+			complete: function () {
+				PageLoading = false;
 			}
 		})
 	}
-)
+
+	$(document).on("click", ".load-more", function (e) {
+		e.preventDefault();
+		loadNextPage($(this));
+	})
+
+	$(window).on("scroll", function () {
+		var LoadMore = $(".load-more");
+		if (LoadMore.length && $(window).scrollTop() + $(window).height() > LoadMore.offset().top - 300) {
+			loadNextPage(LoadMore);
+		}
+	})
 
 	// var PrInCartCount = $("#prod-cart-count");
 	// var CartCount = parseInt(PrInCartCount.text() || 0);
@@ -1,6 +1,10 @@
 from django import template
 from django.contrib.auth import get_user_model
 from django.db.models import Sum
+from django.utils.safestring import mark_safe
+
+from chipi.cart import cart_summary
+from chipi.categories import category_tree_html
 
 from chipi.models import *
 
@@ -14,14 +18,20 @@ def get_cart(filter=None):
 
     if not filter:
         return 0
-    else:
-        buyer = Buyer.objects.get(user_id=filter)
-        return Cart.objects.filter(user=buyer).aggregate(total_count=Sum('count'))['total_count'] or 0
-        # return Cart.objects.filter(user=buyer).count()
-    return 0
+    return cart_summary(filter)['count']
 
 
 @register.simple_tag
 def get_category():
     cat = ProdCategory.objects.all()
     return cat
+
+
+@register.simple_tag
+def category_tree():
+    return mark_safe(category_tree_html())
+
+
+@register.filter
+def lookup(mapping, key):
+    return mapping.get(key) if mapping else None
@@ -23,8 +23,12 @@ urlpatterns = [
     path('cart-add-ajax/', views.cart_add_ajax, name='cart_add_ajax'),
     # path('cart-add-ajax1/', views.cart_add_ajax, name='cart_add_ajax1'),
     path('cart-decr-index_ajax/', views.cart_decr_in_index_ajax, name='cart_decr_in_index_ajax'),
+    path('cart-batch/', views.cart_batch, name='cart_batch'),
     path('orders/', views.show_orders, name='orders'),
     path('orders_shop/', views.show_orders_for_shop, name='orders_shop'),
+    path('orders_shop/bulk/', views.bulk_update_orders, name='bulk_update_orders'),
+    path('orders_shop/export/', views.export_orders, name='export_orders'),
+    path('orders_shop/analytics/', views.shop_analytics, name='shop_analytics'),
     path('', views.index, name='home'),
     path('s/', views.search, name='search'),
     path('rem_review/<int:rev_id>/', views.rem_review, name='rem_review'),
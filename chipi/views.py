@@ -1,19 +1,54 @@
+import json
 import os
+import uuid
 
 from django.contrib.auth.decorators import login_required
 from django.http import (
+    Http404,
     HttpResponse,
     HttpResponseNotFound,
     HttpResponseRedirect,
     JsonResponse,
+    StreamingHttpResponse,
 )
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.urls import reverse_lazy  # type: ignore
+from django.utils.dateparse import parse_date
 from django.forms import modelformset_factory
 
 from users.forms import AddressForm, PaymentTestForm
 from users.models import Address
-from .forms import AddProdForm, ImageForm, ReviewForm, EditOrderForm
+from .forms import AddProdForm, ImageForm, ReviewForm, EditOrderForm, BulkOrderForm
+from .cart import (
+    add_to_cart,
+    apply_cart_changes,
+    cart_lines,
+    cart_summary,
+    cart_totals,
+    invalidate_cart_summary,
+    reconcile_carts,
+    remove_from_cart,
+)
+from .analytics import sales_period, sales_report
+from .export import csv_stream, export_rows, jsonl_stream
+from .idempotency import idempotent
+from .listing import product_listing, user_overlay
+from .orders import (
+    ORDERS_ORDERING,
+    ORDERS_PER_PAGE,
+    StockChanged,
+    buyer_order_groups,
+    parse_status,
+    place_order,
+    shop_order_lines,
+    status_tabs,
+    update_orders,
+)
+from .pagination import keyset_page
+from .ranking import invalidate_feed, personal_feed
+from .recommendations import product_neighbors
+from .reservations import hold_cart
 from .models import (
     Product,
     Category,
@@ -25,46 +60,59 @@ from .models import (
     ProdCategory,
     Review,
 )
-from django.db.models import Avg, Count, Q, Sum, Min
+from django.db.models import Count, F, Sum
 
 
 # Create your views here.
 
 
-def get_products(user, search_query=None):
-    filters = {}
-    if search_query:
-        filters["title__icontains"] = search_query
+def get_buyer(user):
+    return user.buyer if user.is_authenticated and user.is_buyer else None
 
-    products = (
-        Product.objects.filter(**filters)
-        .annotate(mark=Avg("reviews__score"))
-        .select_related("shop")
-    )
 
-    if user.is_authenticated and user.is_buyer:
-        products = products.annotate(
-            count_in_cart=Min("cart__count", filter=Q(cart__user=user.buyer))
-        )
+def next_page_url(request, page):
+    if not page.has_next:
+        return None
+    query = request.GET.copy()
+    query["cursor"] = page.next_cursor
+    return f"{request.path}?{query.urlencode()}"
+
 
-    return products
+def render_page(request, template_name, context, page, items_template):
+    """Рендерит страницу списка, а для AJAX-запроса - только элементы следующей страницы."""
+    context = {**context, "next_url": next_page_url(request, page)}
+    if request.headers.get("x-requested-with") == "XMLHttpRequest":
+        return JsonResponse({
+            "html": render_to_string(items_template, context, request=request),
+            "next_url": context["next_url"],
+        })
+    return render(request, template_name, context)
+
+
+def render_products(request, template_name, context, page, cards_template="chipi/product_cards.html"):
+    cart_counts, favorite_ids = user_overlay(get_buyer(request.user), [p.id for p in page])
+    context = {
+        **context,
+        "prod": page.items,
+        "cart_counts": cart_counts,
+        "favorite_ids": favorite_ids,
+    }
+    return render_page(request, template_name, context, page, cards_template)
 
 
 @login_required
 def index(request):
     search_query = request.GET.get("q", "")
-    products = get_products(request.user, search_query)
-    fav_prod = (
-        Product.objects.filter(favorite__user=request.user.buyer)
-        if request.user.is_authenticated
-        else []
-    )
+    products = product_listing(search_query=search_query)
+    cursor = request.GET.get("cursor")
+    page = keyset_page(products, cursor)
 
-    return render(
-        request,
-        "chipi/index2.html",
-        {"prod": products, "fav_prod": fav_prod, "search_text": search_query},
-    )
+    # персональная подборка - только над первой страницей ленты без поиска
+    feed = []
+    if request.user.is_buyer and not search_query and not cursor:
+        feed = personal_feed(request.user)
+
+    return render_products(request, "chipi/index2.html", {"search_text": search_query, "feed": feed}, page)
 
 
 def catg(request, cat_id):
@@ -95,7 +143,7 @@ def show_product(request, product_id):
     photos = ProductImage.objects.filter(product=product)
     reviews = Review.objects.filter(product=product)
     user_bought = Order.objects.filter(
-        product=product, user=request.user.buyer, status=Order.Status.DELIVERED
+        product=product, group__user=request.user.buyer, status=Order.Status.DELIVERED
     ).exists()
 
     if request.method == "POST" and user_bought:
@@ -123,13 +171,14 @@ def show_product(request, product_id):
             "reviews": reviews,
             "is_bought": user_bought,
             "rev_count": reviews.count(),
+            "also_bought": product_neighbors(product.pk),
         },
     )
 
 def show_shop(request, seller_id):
     shop = get_object_or_404(Shop, pk=seller_id)
-    products = Product.objects.filter(shop_id=shop.pk)
-    return render(request, "chipi/shop.html", context={"prod": products, "shop": shop})
+    page = keyset_page(Product.objects.filter(shop_id=shop.pk), request.GET.get("cursor"))
+    return render_products(request, "chipi/shop.html", {"shop": shop}, page, "chipi/shop_cards.html")
 
 
 # @login_required
@@ -139,140 +188,110 @@ from django.contrib import messages
 
 @login_required
 def cart_add(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
+    count, stock, added = add_to_cart(request.user.buyer, product_id)
 
-    if product.count == 0:
+    if stock is None:
+        raise Http404
+    if stock == 0:
         messages.error(request, "Товар закончился на складе.")
-        return HttpResponseRedirect(request.META.get("HTTP_REFERER", "/"))
-
-    cart, created = Cart.objects.get_or_create(
-        user=request.user.buyer, product=product, defaults={"count": 1}
-    )
-
-    if not created:
-        if cart.count < product.count:
-            cart.count += 1
-            cart.save()
-        else:
-            messages.warning(request, "Достигнуто максимальное количество товара в корзине.")
+    elif not added:
+        messages.warning(request, "Достигнуто максимальное количество товара в корзине.")
 
     return HttpResponseRedirect(request.META.get("HTTP_REFERER", "/"))
 
 
 
+@idempotent
 def cart_add_ajax(request):
-    product_id = request.POST.get("product_id")
-    product = Product.objects.get(id=product_id)
-    carts = Cart.objects.filter(user=request.user.buyer, product=product)
-    if not carts.exists():
-        Cart.objects.create(user=request.user.buyer, product=product, count=1)
-        if int(product.count) <= 2:
-            response_data = {
-                "status": "success",
-                "product_id": product.id,
-                "last": True,
-                "max": True,
-            }
-        else:
-            response_data = {
-                "status": "success",
-                "product_id": product.id,
-                "last": False,
-                "max": True,}
-    else:
-        cart = carts.first()
-        if int(product.count) <= int(cart.count) + 1:
-            response_data = {
-                "status": "success",
-                "product_id": product.id,
-                "last": True,
-                "max": True,
-            }
-        else:
-            response_data = {
-                "status": "success",
-                "product_id": product.id,
-                "last": False,
-                "max": True,
-            }
-        if int(product.count) > int(cart.count):
-            cart.count += 1
-            response_data["max"] = False
-
-        cart.save()
-
-    # response_data = {'status': 'success', 'product_id': product.id, 'aaa': 'bbb'}
+    try:
+        product_id = int(request.POST.get("product_id"))
+    except (TypeError, ValueError):
+        return JsonResponse({"status": "error"}, status=400)
+    count, stock, added = add_to_cart(request.user.buyer, product_id)
+    response_data = {
+        "status": "success",
+        "product_id": product_id,
+        "count": count,
+        "last": count >= (stock or 0),
+        "max": not added,
+        "cart": cart_summary(request.user.pk),
+    }
     return JsonResponse(response_data)
-    # return render('home')
 
 
 def cart_delete(request, cart_id):
-    cart = Cart.objects.get(id=cart_id)
-    cart.delete()
+    Cart.objects.filter(id=cart_id, user=request.user.buyer).delete()
+    invalidate_cart_summary(request.user.pk)
     return HttpResponseRedirect(request.META.get("HTTP_REFERER"))
 
 
 def cart_decr(request, cart_id):
-    cart = Cart.objects.get(id=cart_id)
-    if cart.count != 1:
-        cart.count -= 1
-    cart.save()
+    Cart.objects.filter(id=cart_id, user=request.user.buyer, count__gt=1).update(count=F("count") - 1)
+    invalidate_cart_summary(request.user.pk)
     return HttpResponseRedirect(request.META.get("HTTP_REFERER"))
 
 
 def cart_decr_in_index(request, product_id):
-    cart = Cart.objects.get(product_id=product_id, user=request.user.buyer)
-    if cart.count != 1:
-        cart.count -= 1
-        cart.save()
-    else:
-        cart.delete()
+    remove_from_cart(request.user.buyer, product_id)
     return HttpResponseRedirect(request.META.get("HTTP_REFERER"))
 
 
+@idempotent
 def cart_decr_in_index_ajax(request):
-    product_id = request.POST.get("product_id")
-    cart = Cart.objects.get(product_id=product_id, user=request.user.buyer)
-    if cart.count != 1:
-        cart.count -= 1
-        cart.save()
-    else:
-        cart.delete()
-    response_data = {"status": "success", "aaa": "bbb"}
+    try:
+        product_id = int(request.POST.get("product_id"))
+    except (TypeError, ValueError):
+        return JsonResponse({"status": "error"}, status=400)
+    count = remove_from_cart(request.user.buyer, product_id)
+    response_data = {"status": "success", "count": count, "cart": cart_summary(request.user.pk)}
     return JsonResponse(response_data)
 
-#lab4
 
-def clean_cart(user):
-    """Удаляет пустые товары и корректирует количество в корзине."""
-    carts = Cart.objects.filter(user=user).order_by("-time_created")
-    new_cart = []
-    
-    for cart in carts:
-        if cart.product.count == 0:
-            cart.delete()
-        elif cart.count > cart.product.count:
-            cart.count = cart.product.count
-            cart.save()
-            new_cart.append(cart)
-        else:
-            new_cart.append(cart)
-    
-    return new_cart
+# ограничения пачки изменений корзины: число операций и итоговое изменение по одному товару
+CART_BATCH_MAX_OPS = 100
+CART_BATCH_MAX_DELTA = 1000
 
-def calculate_cart_totals(carts):
-    """Вычисляет общую сумму и количество товаров."""
-    total_count = sum(cart.count for cart in carts)
-    total_sum = sum(cart.sum() for cart in carts)
-    return total_count, total_sum
 
+@idempotent
+def cart_batch(request):
+    """Несколько изменений корзины за один запрос: ops = [{"product_id": 1, "delta": 2}, ...]."""
+    if request.method != "POST" or not request.user.is_authenticated or not request.user.is_buyer:
+        return JsonResponse({"status": "error"}, status=403)
+
+    changes = {}
+    try:
+        ops = json.loads(request.POST.get("ops", "[]"))
+        if not isinstance(ops, list) or len(ops) > CART_BATCH_MAX_OPS:
+            raise ValueError
+        for op in ops:
+            product_id = int(op["product_id"])
+            if not 0 < product_id < 2**63:
+                raise ValueError
+            changes[product_id] = changes.get(product_id, 0) + int(op["delta"])
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({"status": "error"}, status=400)
+    if any(abs(delta) > CART_BATCH_MAX_DELTA for delta in changes.values()):
+        return JsonResponse({"status": "error"}, status=400)
+
+    counts = apply_cart_changes(request.user.buyer, changes)
+    response_data = {
+        "status": "success",
+        "items": {
+            product_id: {"count": count, "last": count >= stock}
+            for product_id, (count, stock) in counts.items()
+        },
+        "cart": cart_summary(request.user.pk),
+    }
+    return JsonResponse(response_data)
+
+#lab4
 
 def show_cart(request):
     if not request.user.is_buyer:
         return HttpResponseNotFound("<h1>Корзина не доступна в режиме магазина</h1>") if request.user.is_shop else redirect("users:login")
 
-    carts = clean_cart(request.user.buyer)
-    total_count, total_sum = calculate_cart_totals(carts)
+    carts = cart_lines(request.user.buyer)
+    total_count, total_sum = cart_totals(request.user.buyer)
 
     return render(
         request, 
@@ -308,25 +327,28 @@ def create_order(request):
                 user.buyer.save()
             return redirect("create_order")
 
-    carts = clean_cart(user.buyer)
+    carts = cart_lines(user.buyer)
     if not carts:
         return redirect("home")
 
-    total_count, total_sum = calculate_cart_totals(carts)
+    # товары резервируются на время оформления, чтобы их не выкупили другие покупатели
+    holds = hold_cart(user.buyer, carts)
+    total_count, total_sum = cart_totals(user.buyer)
 
     return render(
         request, 
         "chipi/create_order.html", 
-        context={"products": carts, "total_count": total_count, "total_sum": total_sum, "form": form}
+        context={"products": carts, "holds": holds, "total_count": total_count, "total_sum": total_sum, "form": form}
     )
 
 
+@idempotent
 def pay_order(request):
     if not request.user.is_buyer:
         return HttpResponseNotFound("<h1>Оформление заказа недоступно в режиме магазина</h1>") if request.user.is_shop else redirect("users:login")
 
     user = request.user
-    carts = clean_cart(user.buyer)
+    carts = cart_lines(user.buyer)
     address = user.buyer.correct_address
 
     if not address:
@@ -337,43 +359,20 @@ def pay_order(request):
 
     form = PaymentTestForm(request.POST or None)
     if request.method == "POST" and form.is_valid():
-        for cart in carts:
-            if cart.count > cart.product.count:
-                form.add_error(None, "Количество доступных товаров изменилось")
-                return redirect("pay_order")
-
-        # Создание заказа и обновление товаров
-        for cart in carts:
-            cart.product.count -= cart.count
-            cart.product.save()
-            Order.objects.create(
-                user=user.buyer, 
-                product=cart.product, 
-                shop=cart.product.shop,
-                count=cart.count, 
-                price=cart.product.price, 
-                title=cart.product.title,
-                first_name=address.first_name, 
-                middle_name=address.middle_name, 
-                last_name=address.last_name,
-                email=address.email, 
-                phone=address.phone, 
-                country=address.country,
-                region=address.region, 
-                city=address.city, 
-                index=address.index, 
-                addr=address.addr,
-            )
-            cart.delete()
+        try:
+            place_order(user.buyer, address, carts, card_last4=form.cleaned_data["card_num"][-4:])
+        except StockChanged:
+            messages.error(request, "Количество доступных товаров изменилось")
+            return redirect("pay_order")
 
         return redirect("orders")
 
-    total_count, total_sum = calculate_cart_totals(carts)
+    total_count, total_sum = cart_totals(user.buyer)
 
     return render(
         request, 
         "chipi/pay_order.html", 
-        context={"total_count": total_count, "total_sum": total_sum, "form": form}
+        context={"total_count": total_count, "total_sum": total_sum, "form": form, "idempotency_key": uuid.uuid4().hex}
     )
 
 #End_lab4
@@ -385,6 +384,7 @@ def add_fav(request, product_id):
         == 0
     ):
         Favorite.objects.create(user=request.user.buyer, product=product)
+        invalidate_feed(request.user.pk)
     # request.user.buyer.favorite.add(product_id)
     return HttpResponseRedirect(request.META.get("HTTP_REFERER"))
 
@@ -393,6 +393,7 @@ def rem_fav(request, product_id):
     fav = Favorite.objects.get(user=request.user.buyer, product=product_id)
 
     fav.delete()
+    invalidate_feed(request.user.pk)
     return HttpResponseRedirect(request.META.get("HTTP_REFERER"))
 
 
@@ -402,18 +403,9 @@ def page_not_found(request, exception):
 
 def show_favorites(request):
     if request.user.is_buyer:
-        favs = (
-            Product.objects.filter(favorite__user=request.user.buyer)
-            .annotate(mark=Avg("reviews__score"))
-            .order_by("id")
-            .select_related("shop")
-            .annotate(
-                count_in_cart=Min(
-                    "cart__count", filter=Q(cart__user=request.user.buyer)
-                )
-            )
-        )
-        return render(request, "chipi/favorites.html", context={"prod": favs})
+        favs = list(product_listing(favorites_of=request.user.buyer))
+        cart_counts, _ = user_overlay(request.user.buyer, [p.id for p in favs])
+        return render(request, "chipi/favorites.html", context={"prod": favs, "cart_counts": cart_counts})
     elif request.user.is_shop:
         return HttpResponseNotFound(
             "<h1>Список желаний не доступен в режиме магазина</h1>"
@@ -429,9 +421,14 @@ def show_orders(request):
     if not user.is_buyer:
         return HttpResponseNotFound("<h1>Страница не найдена</h1>")
 
-    orders = Order.objects.filter(user=request.user.buyer).order_by("-time_created")
+    status = parse_status(request.GET.get("status"))
+    page = keyset_page(
+        buyer_order_groups(user.buyer, status), request.GET.get("cursor"), ORDERS_ORDERING, ORDERS_PER_PAGE
+    )
+    tabs = status_tabs(Order.objects.filter(group__user=user.buyer), Count("group", distinct=True))
+    context = {"groups": page.items, "tabs": tabs, "status": status}
 
-    return render(request, "chipi/orders.html", context={"orders": orders})
+    return render_page(request, "chipi/orders.html", context, page, "chipi/order_groups.html")
 
 
 def show_orders_for_shop(request):
@@ -441,9 +438,70 @@ def show_orders_for_shop(request):
     if not user.is_shop:
         return HttpResponseNotFound("<h1>Страница не найдена</h1>")
 
-    orders = Order.objects.filter(shop=request.user.shop).order_by("-time_created")
+    status = parse_status(request.GET.get("status"))
+    page = keyset_page(
+        shop_order_lines(user.shop, status), request.GET.get("cursor"), ORDERS_ORDERING, ORDERS_PER_PAGE
+    )
+    tabs = status_tabs(Order.objects.filter(shop=user.shop))
+    context = {"orders": page.items, "tabs": tabs, "status": status, "bulk_form": BulkOrderForm()}
+
+    return render_page(request, "chipi/orders_shop.html", context, page, "chipi/order_lines.html")
+
+
+def bulk_update_orders(request):
+    """Смена статуса отмеченных строк заказов и загрузка трек-номеров из CSV."""
+    user = request.user
+    if not user.is_authenticated or not user.is_shop:
+        return HttpResponseNotFound("<h1>Страница не найдена</h1>")
+    if request.method != "POST":
+        return redirect("orders_shop")
+
+    form = BulkOrderForm(request.POST, request.FILES)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+        return redirect("orders_shop")
+
+    order_ids = [int(pk) for pk in request.POST.getlist("orders") if pk.isdigit()]
+    status_count, track_count = update_orders(
+        user.shop, order_ids, form.cleaned_data["status"], form.cleaned_data["tracks"]
+    )
+    messages.success(request, f"Статус изменён: {status_count}, трек-номеров обновлено: {track_count}")
+    return HttpResponseRedirect(request.META.get("HTTP_REFERER") or reverse_lazy("orders_shop"))
+
+
+def export_orders(request):
+    """Выгрузка строк заказов магазина в CSV или JSONL потоком, с фильтрами по датам и статусу."""
+    user = request.user
+    if not user.is_authenticated or not user.is_shop:
+        return HttpResponseNotFound("<h1>Страница не найдена</h1>")
+
+    rows = export_rows(
+        user.shop,
+        request.GET.get("date_from"),
+        request.GET.get("date_to"),
+        parse_status(request.GET.get("status")),
+    )
+    if request.GET.get("format") == "jsonl":
+        response = StreamingHttpResponse(jsonl_stream(rows), content_type="application/x-ndjson; charset=utf-8")
+        extension = "jsonl"
+    else:
+        response = StreamingHttpResponse(csv_stream(rows), content_type="text/csv; charset=utf-8")
+        extension = "csv"
+    response["Content-Disposition"] = f'attachment; filename="orders-{user.shop.pk}.{extension}"'
+    return response
+
 
-    return render(request, "chipi/orders_shop.html", context={"orders": orders})
+def shop_analytics(request):
+    """Выручка, штуки и позиции заказов магазина по дням и по товарам из сводки ShopDailySales."""
+    user = request.user
+    if not user.is_authenticated or not user.is_shop:
+        return HttpResponseNotFound("<h1>Страница не найдена</h1>")
+
+    date_from, date_to = sales_period(parse_day(request.GET.get("date_from")), parse_day(request.GET.get("date_to")))
+    context = {"date_from": date_from, "date_to": date_to, **sales_report(user.shop, date_from, date_to)}
+    return render(request, "chipi/shop_analytics.html", context)
 
 
 def addprod(request):
@@ -481,23 +539,6 @@ def addprod(request):
 
 #lab4
 
-def clean_user_cart(user):
-    carts = Cart.objects.filter(user=user).order_by("-time_created")
-    for cart in carts:
-        if cart.product.count == 0:
-            cart.delete()
-        elif cart.count > cart.product.count:
-            cart.count = cart.product.count
-            cart.save()
-
-
-def get_favorite_products(user, category=None):
-    filters = {"favorite__user": user}
-    if category:
-        filters["prodcategory_id"] = category.pk
-    return Product.objects.filter(**filters)
-
-
 def parse_price(value, default):
     try:
         return int(value)
@@ -505,6 +546,14 @@ def parse_price(value, default):
         return default
 
 
+def parse_day(value):
+    """Дата ГГГГ-ММ-ДД из запроса; None, если её нет или такого дня не бывает."""
+    try:
+        return parse_date(value or "")
+    except ValueError:
+        return None
+
+
 def edit_product(request, product_id):
     product = get_object_or_404(Product, pk=product_id)
     photos = ProductImage.objects.filter(product=product)
@@ -519,6 +568,7 @@ def edit_product(request, product_id):
         form = AddProdForm(request.POST, request.FILES, instance=product)
         if form.is_valid():
             form.save()
+            reconcile_carts(Cart.objects.filter(product=product))
             uploaded_files = request.FILES.getlist("files")
             if uploaded_files:
                 existing_images = ProductImage.objects.filter(product=product)
@@ -539,89 +589,49 @@ def edit_product(request, product_id):
     return render(request, "chipi/edit_product.html", {"form": form, "product": product, "photos": photos})
 
 
-def get_filtered_products(user=None, category=None, search_query="", min_price=0, max_price=10**9):
-    filters = {"title__icontains": search_query, "price__gte": min_price, "price__lte": max_price}
-    if category:
-        filters["prodcategory__in"] = category.get_descendants(include_self=True)
-
-    queryset = Product.objects.filter(**filters).annotate(mark=Avg("reviews__score")).order_by("id").select_related("shop")
-
-    if user:
-        queryset = queryset.annotate(
-            count_in_cart=Min("cart__count", filter=Q(cart__user=user))
-        )
-    return queryset
-
-
 def search(request):
-    user = request.user
     search_query = request.GET.get("q") or ""
     min_pr = parse_price(request.GET.get("min_price"), 0)
     max_pr = parse_price(request.GET.get("max_price"), 10**9)
     categories = ProdCategory.objects.filter(parent=None)
 
-    if user.is_authenticated and user.is_buyer:
-        clean_user_cart(user.buyer)
-        fav_prod = get_favorite_products(user.buyer)
-        products = get_filtered_products(user=user.buyer, search_query=search_query, min_price=min_pr, max_price=max_pr)
-    else:
-        fav_prod = []
-        products = get_filtered_products(search_query=search_query, min_price=min_pr, max_price=max_pr)
+    products = product_listing(search_query=search_query, min_price=min_pr, max_price=max_pr)
 
     context = {
-        "prod": products,
-        "fav_prod": fav_prod,
         "search_text": search_query,
         "min_pr": request.GET.get("min_price") or "",
         "max_pr": request.GET.get("max_price") or "",
         "ctgs": categories,
     }
-    return render(request, "chipi/search.html", context=context)
+    page = keyset_page(products, request.GET.get("cursor"))
+    return render_products(request, "chipi/search.html", context, page)
 
 
 def show_category(request, category_slug):
     category = get_object_or_404(ProdCategory, slug=category_slug)
-    current_category = category
-    children_categories = current_category.get_descendants(include_self=True)
-    path = []
-    while current_category:
-        path.insert(0, current_category)
-        current_category = current_category.parent
+    path = category.get_ancestors(include_self=True)
 
     search_query = request.GET.get("q") or ""
     min_pr = parse_price(request.GET.get("min_price"), 0)
     max_pr = parse_price(request.GET.get("max_price"), 10**9)
     next_ctgs = ProdCategory.objects.filter(parent=category)
 
-    if request.user.is_authenticated and request.user.is_buyer:
-        clean_user_cart(request.user.buyer)
-        fav_prod = get_favorite_products(request.user.buyer, category)
-        products = get_filtered_products(
-            user=request.user.buyer,
-            category=category,
-            search_query=search_query,
-            min_price=min_pr,
-            max_price=max_pr
-        )
-    else:
-        fav_prod = []
-        products = get_filtered_products(
-            category=category,
-            search_query=search_query,
-            min_price=min_pr,
-            max_price=max_pr
-        )
+    products = product_listing(
+        category=category,
+        search_query=search_query,
+        min_price=min_pr,
+        max_price=max_pr
+    )
 
     context = {
         "search_text": search_query,
         "min_pr": request.GET.get("min_price") or "",
         "max_pr": request.GET.get("max_price") or "",
         "ctgs": next_ctgs,
-        "prod": products,
-        "fav_prod": fav_prod,
         "path": path,
     }
-    return render(request, "chipi/cats.html", context=context)
+    page = keyset_page(products, request.GET.get("cursor"))
+    return render_products(request, "chipi/cats.html", context, page)
 
 #end4
 
@@ -633,7 +643,7 @@ def rem_review(request, rev_id):
 
 
 def edit_order(request, order_id):
-    order = get_object_or_404(Order, pk=order_id)
+    order = get_object_or_404(Order.objects.select_related("group", "product"), pk=order_id)
 
     user = request.user
     if not user.is_shop:
@@ -646,7 +656,9 @@ def edit_order(request, order_id):
     if request.method == "POST":
         form = EditOrderForm(request.POST, instance=order)
         if form.is_valid():
-            form.save()
+            update_orders(
+                user.shop, [order.pk], form.cleaned_data["status"], {order.pk: form.cleaned_data["track"]}
+            )
             return redirect(reverse_lazy("edit_order", kwargs={"order_id": order_id}))
 
     return render(request, "chipi/edit_order.html", {"form": form, "order": order})